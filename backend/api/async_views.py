@@ -0,0 +1,350 @@
+"""Асинхронные представления горячих запросов на чтение.
+
+GET-запросы к спискам и карточкам рецептов, тегам, ингредиентам и
+коротким ссылкам обслуживаются корутинами на асинхронном ORM и не
+занимают поток на время ожидания базы. Всё, что асинхронный путь не
+обслуживает (запись, ошибки авторизации, неверные фильтры, 404,
+курсорная пагинация, browsable API), передаётся синхронному
+представлению DRF, поэтому ответы совпадают.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.paginator import InvalidPage, Page, Paginator
+from django.http import Http404, HttpResponse
+from django.shortcuts import redirect
+from django.utils.cache import get_conditional_response
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+
+from users.models import Follow, Ingredient, Recipe, Tag, User
+
+from . import short_links
+from .caching import (aget_recipe_data_state, aget_user_state_version,
+                      get_response_cache_key, get_response_cache_timeout,
+                      get_validators, set_validators)
+from .filters import IngredientFilter
+from .ingredient_index import ingredient_index
+from .pagination import CustomLimitPagination
+from .serializers import (IngredientInfoSerializer, RecipeInfoSerializer,
+                          TagInfoSerializer)
+from .views import (IngredientListViewSet, RecipeManagementViewSet,
+                    TagListViewSet)
+
+renderer = JSONRenderer()
+TRUE_VALUES = ('1', 'true')
+INGREDIENT_FILTERS = (
+    ('ingredients', 'with_ingredients'),
+    ('exclude_ingredients', 'without_ingredients'),
+)
+
+
+class Fallback(Exception):
+    """Запрос должен обработать синхронное представление."""
+
+
+def sync_view(viewset, actions, basename, detail):
+    """Синхронное представление DRF, как его строит роутер."""
+    return viewset.as_view(actions, basename=basename, detail=detail)
+
+
+def async_read_view(view):
+    """
+    Декоратор корутины-обработчика GET с откатом на синхронный view
+    """
+    allow = ', '.join(
+        method.upper() for method in view.cls.http_method_names
+        if method in view.actions or method in ('head', 'options')
+    )
+    fallback = sync_to_async(view)
+
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(request, *args, **kwargs):
+            if request.method == 'GET' and accepts_json(request):
+                try:
+                    await authenticate(request)
+                    response = await handler(request, *args, **kwargs)
+                except Fallback:
+                    pass
+                else:
+                    response['Allow'] = allow
+                    response['Vary'] = 'Accept'
+                    return response
+            return await fallback(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def accepts_json(request):
+    return (
+        'format' not in request.GET
+        and 'text/html' not in request.headers.get('Accept', '')
+    )
+
+
+async def authenticate(request):
+    """Авторизация по токену, как в TokenAuthentication."""
+    request.user = AnonymousUser()
+    auth = request.headers.get('Authorization', '').split()
+    if not auth or auth[0].lower() != 'token':
+        return
+    if len(auth) != 2:
+        raise Fallback
+    token = await Token.objects.select_related('user').filter(
+        key=auth[1]
+    ).afirst()
+    if token is None or not token.user.is_active:
+        raise Fallback
+    request.user = token.user
+
+
+async def load_subscriptions(request):
+    """Подписки пользователя для get_subscribed_author_ids."""
+    request._subscribed_author_ids = set()
+    if request.user.is_authenticated:
+        request._subscribed_author_ids = {
+            author_id async for author_id in Follow.objects.filter(
+                user=request.user
+            ).values_list('author_id', flat=True)
+        }
+
+
+def render(data):
+    return HttpResponse(
+        renderer.render(data), content_type=renderer.media_type
+    )
+
+
+async def conditional(request, build, version, last_modified=None,
+                      cache_prefix=None):
+    """
+    Ответ с ETag по версии данных и Last-Modified
+    Как ConditionalGetMixin: 304, если клиентская копия актуальна;
+    с cache_prefix данные для анонимов берутся из кеша ответов, общего с
+    AnonymousCacheMixin. Версии и кеш читаются асинхронным API кеша, не
+    блокируя цикл событий.
+    """
+    etag, last_modified = get_validators(request, version, last_modified)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        key = None
+        if cache_prefix and request.user.is_anonymous:
+            # Версия ответа для анонима — версия данных рецептов.
+            key = get_response_cache_key(request, cache_prefix, version)
+            data = await cache.aget(key)
+        if key is None or data is None:
+            data = await build()
+            if key is not None:
+                await cache.aset(key, data, get_response_cache_timeout(
+                    settings.RECIPE_CACHE_TIMEOUT
+                ))
+        response = render(data)
+    return set_validators(response, etag, last_modified)
+
+
+async def filter_recipes(request, queryset):
+    """Фильтры RecipeFilter; неверные значения обработает DRF."""
+    params = request.GET
+    tags = {slug for slug in params.getlist('tags') if slug}
+    if tags:
+        if await Tag.objects.filter(slug__in=tags).acount() != len(tags):
+            raise Fallback
+        queryset = queryset.filter(tags__slug__in=tags).distinct()
+    for param, method in INGREDIENT_FILTERS:
+        ids = {value for value in params.getlist(param) if value}
+        if ids:
+            if not all(value.isdigit() for value in ids) or (
+                await Ingredient.objects.filter(pk__in=ids).acount()
+                != len(ids)
+            ):
+                raise Fallback
+            queryset = getattr(queryset, method)(map(int, ids))
+    author = params.get('author')
+    if author:
+        if not author.isdigit() or not await User.objects.filter(
+            pk=author
+        ).aexists():
+            raise Fallback
+        queryset = queryset.filter(author=author)
+    user = request.user
+    if user.is_authenticated:
+        if params.get('is_favorited', '').lower() in TRUE_VALUES:
+            queryset = queryset.filter(favorite__user=user)
+        if params.get('is_in_shopping_cart', '').lower() in TRUE_VALUES:
+            queryset = queryset.filter(shopping_list__user=user)
+    search = params.get('search', '').strip()
+    if search:
+        queryset = queryset.search(search)
+    return queryset
+
+
+async def get_recipe_validators(request):
+    """Версия для ETag и Last-Modified, как в RecipeManagementViewSet."""
+    version, changed_at = await aget_recipe_data_state()
+    if request.user.is_anonymous:
+        return version, changed_at
+    return version + await aget_user_state_version(request.user), None
+
+
+def get_page_size(request, pagination):
+    try:
+        page_size = int(request.GET[pagination.page_size_query_param])
+    except (KeyError, ValueError):
+        return pagination.page_size
+    return page_size if page_size > 0 else pagination.page_size
+
+
+def serialize_recipes(request, recipes, many=False):
+    return RecipeInfoSerializer(
+        recipes, many=many, context={'request': request}
+    ).data
+
+
+@async_read_view(sync_view(
+    RecipeManagementViewSet, {'get': 'list', 'post': 'create'},
+    'recipes', False,
+))
+async def recipe_list(request):
+    if request.GET.keys() & {'cursor', 'pagination'}:
+        raise Fallback
+    queryset = await filter_recipes(request, Recipe.objects.all())
+
+    async def build():
+        pagination = CustomLimitPagination()
+        paginator = Paginator(queryset, get_page_size(request, pagination))
+        paginator.count = await queryset.acount()
+        number = request.GET.get(pagination.page_query_param) or 1
+        if number in pagination.last_page_strings:
+            number = paginator.num_pages
+        try:
+            number = paginator.validate_number(number)
+        except InvalidPage:
+            raise Fallback
+        bottom = (number - 1) * paginator.per_page
+        recipes = [
+            recipe async for recipe in queryset.with_related()
+            .with_user_flags(request.user)[bottom:bottom + paginator.per_page]
+        ]
+        await load_subscriptions(request)
+        pagination.request = request
+        pagination.page = Page(recipes, number, paginator)
+        return pagination.get_paginated_response(
+            serialize_recipes(request, recipes, many=True)
+        ).data
+
+    version, last_modified = await get_recipe_validators(request)
+    return await conditional(
+        request, build, version, last_modified,
+        cache_prefix='recipes:list',
+    )
+
+
+@async_read_view(sync_view(
+    RecipeManagementViewSet,
+    {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update',
+     'delete': 'destroy'},
+    'recipes', True,
+))
+async def recipe_detail(request, pk):
+    queryset = Recipe.objects.filter(pk=pk)
+
+    async def build():
+        recipe = await queryset.with_related().with_user_flags(
+            request.user
+        ).afirst()
+        if recipe is None:
+            raise Fallback
+        await load_subscriptions(request)
+        return serialize_recipes(request, recipe)
+
+    version, last_modified = await get_recipe_validators(request)
+    return await conditional(
+        request, build, version, last_modified,
+        cache_prefix='recipes:retrieve',
+    )
+
+
+@async_read_view(sync_view(TagListViewSet, {'get': 'list'}, 'tags', False))
+async def tag_list(request):
+
+    async def build():
+        return TagInfoSerializer(
+            [tag async for tag in Tag.objects.all()], many=True
+        ).data
+
+    version, changed_at = await aget_recipe_data_state()
+    return await conditional(
+        request, build, version, last_modified=changed_at
+    )
+
+
+@async_read_view(sync_view(
+    TagListViewSet, {'get': 'retrieve'}, 'tags', True
+))
+async def tag_detail(request, pk):
+    async def build():
+        tag = await Tag.objects.filter(pk=pk).afirst()
+        if tag is None:
+            raise Fallback
+        return TagInfoSerializer(tag).data
+
+    version, changed_at = await aget_recipe_data_state()
+    return await conditional(
+        request, build, version, last_modified=changed_at
+    )
+
+
+@async_read_view(sync_view(
+    IngredientListViewSet, {'get': 'list'}, 'ingredients', False
+))
+async def ingredient_list(request):
+    async def build():
+        if settings.INGREDIENT_SEARCH_MODE == 'index':
+            return await sync_to_async(ingredient_index.search)(
+                request.GET.get('name', '').strip()
+            )
+        filterset = IngredientFilter(
+            request.GET, queryset=Ingredient.objects.all()
+        )
+        if not filterset.is_valid():
+            raise Fallback
+        return IngredientInfoSerializer(
+            [ingredient async for ingredient in filterset.qs], many=True
+        ).data
+
+    version, changed_at = await ingredient_index.aget_version()
+    return await conditional(
+        request, build, version, last_modified=changed_at
+    )
+
+
+@async_read_view(sync_view(
+    IngredientListViewSet, {'get': 'retrieve'}, 'ingredients', True
+))
+async def ingredient_detail(request, pk):
+    async def build():
+        ingredient = await Ingredient.objects.filter(pk=pk).afirst()
+        if ingredient is None:
+            raise Fallback
+        return IngredientInfoSerializer(ingredient).data
+
+    version, changed_at = await ingredient_index.aget_version()
+    return await conditional(
+        request, build, version, last_modified=changed_at
+    )
+
+
+async def short_url_redirect(request, code):
+    """Асинхронный вариант short_url_generate."""
+    if request.method != 'GET':
+        return HttpResponse(status=405, headers={'Allow': 'GET'})
+    pk = await short_links.aresolve(code)
+    if pk is None:
+        raise Http404('Рецепт не найден.')
+    return redirect(f'/recipes/{pk}')
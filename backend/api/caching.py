@@ -0,0 +1,142 @@
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import http_date, quote_etag
+
+from .db_routers import use_replica
+
+RECIPE_DATA_VERSION_CACHE_KEY = 'recipe_data_state'
+USER_STATE_VERSION_CACHE_KEY = 'user_state_version:{}'
+
+
+def get_recipe_data_state():
+    """Версия данных рецептов и время её смены (timestamp)."""
+    state = cache.get(RECIPE_DATA_VERSION_CACHE_KEY)
+    if state is None:
+        state = bump_recipe_data_version()
+    return state
+
+
+async def aget_recipe_data_state():
+    """Асинхронный вариант get_recipe_data_state."""
+    state = await cache.aget(RECIPE_DATA_VERSION_CACHE_KEY)
+    if state is None:
+        state = _new_recipe_data_state()
+        await cache.aset(RECIPE_DATA_VERSION_CACHE_KEY, state, None)
+    return state
+
+
+def get_recipe_data_version():
+    """Текущая версия данных рецептов для ключей кеша ответов."""
+    return get_recipe_data_state()[0]
+
+
+def get_recipe_data_changed_at():
+    """Время последнего изменения данных рецептов для Last-Modified.
+
+    Меняется вместе с версией, в том числе при удалениях и изменениях
+    авторов, тегов и ингредиентов, которых не видно в updated_at рецептов.
+    """
+    return get_recipe_data_state()[1]
+
+
+def bump_recipe_data_version():
+    """Делает все закешированные ответы о рецептах устаревшими.
+
+    Версия — случайный токен, а не счётчик: после вытеснения ключа из
+    кеша новая версия не совпадёт ни с одной из прежних. Вместе с ней
+    хранится время смены.
+    """
+    state = _new_recipe_data_state()
+    cache.set(RECIPE_DATA_VERSION_CACHE_KEY, state, None)
+    return state
+
+
+def _new_recipe_data_state():
+    return uuid.uuid4().hex, int(time.time())
+
+
+def get_user_state_version(user):
+    """Версия избранного, списка покупок и подписок пользователя."""
+    key = USER_STATE_VERSION_CACHE_KEY.format(user.pk)
+    version = cache.get(key)
+    if version is None:
+        version = bump_user_state_version(user.pk)
+    return version
+
+
+async def aget_user_state_version(user):
+    """Асинхронный вариант get_user_state_version."""
+    key = USER_STATE_VERSION_CACHE_KEY.format(user.pk)
+    version = await cache.aget(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        await cache.aset(key, version, None)
+    return version
+
+
+def bump_user_state_version(user_id):
+    """Меняет версию избранного, списка покупок и подписок пользователя."""
+    version = uuid.uuid4().hex
+    cache.set(USER_STATE_VERSION_CACHE_KEY.format(user_id), version, None)
+    return version
+
+
+def get_recipe_etag_version(user):
+    """Версия ответов о рецептах для ETag: авторы, теги и ингредиенты —
+    через версию данных рецептов, флаги пользователя — через версию его
+    состояния."""
+    version = get_recipe_data_version()
+    if user.is_authenticated:
+        version += get_user_state_version(user)
+    return version
+
+
+def get_response_cache_key(request, prefix, version=None):
+    """Ключ кеша ответа по адресу и нормализованным параметрам запроса.
+
+    version — уже прочитанная версия данных рецептов.
+    """
+    params = sorted(
+        (key, sorted(values))
+        for key, values in request.GET.lists()
+    )
+    digest = hashlib.md5(
+        f'{request.build_absolute_uri(request.path)}?{params}'.encode()
+    ).hexdigest()
+    if version is None:
+        version = get_recipe_data_version()
+    return f'{prefix}:{version}:{digest}'
+
+
+def get_response_cache_timeout(timeout):
+    """Срок жизни ответа в кеше; ответ, прочитанный с реплики, может
+    отставать от основной базы, поэтому живёт не дольше окна закрепления
+    за ней."""
+    if use_replica.get():
+        return min(timeout, settings.REPLICA_STICKY_SECONDS)
+    return timeout
+
+
+def get_validators(request, version, last_modified=None):
+    """ETag ответа по версии его данных и Last-Modified (timestamp).
+
+    Версии хранятся в кеше и меняются после фиксации любого изменения
+    данных, в том числе удалений и изменений связанных объектов, поэтому
+    валидаторы считаются без запросов к базе. Без last_modified заголовок
+    Last-Modified не отправляется.
+    """
+    etag = quote_etag(hashlib.md5(
+        f'{request.get_full_path()}:{version}'.encode()
+    ).hexdigest())
+    return etag, last_modified
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
@@ -0,0 +1,58 @@
+import hashlib
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+STICKY_CACHE_KEY = 'primary_sticky:{}'
+# Модели, которые читаются только с основной базы: новый токен должен
+# работать сразу после входа.
+PRIMARY_ONLY_MODELS = ('authtoken.Token',)
+
+use_replica = ContextVar('use_replica', default=False)
+
+
+def get_sticky_key(request):
+    """Ключ клиента для закрепления за основной базой — по токену."""
+    authorization = request.headers.get('Authorization')
+    if not authorization:
+        return None
+    return STICKY_CACHE_KEY.format(
+        hashlib.md5(authorization.encode()).hexdigest()
+    )
+
+
+def stick_to_primary(key):
+    """После записи клиент читает с основной базы REPLICA_STICKY_SECONDS."""
+    cache.set(key, True, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_sticky(key):
+    return key is not None and cache.get(key, False)
+
+
+class PrimaryReplicaRouter:
+    """
+    Чтение с реплик REPLICA_DATABASES, запись в основную базу
+    Реплики используются, только если их разрешил ReplicaRoutingMiddleware
+    для текущего запроса; фоновые задачи, команды и запросы на запись
+    читают с основной базы
+    """
+
+    def db_for_read(self, model, **hints):
+        if (
+            settings.REPLICA_DATABASES and use_replica.get()
+            and model._meta.label not in PRIMARY_ONLY_MODELS
+        ):
+            return random.choice(settings.REPLICA_DATABASES)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
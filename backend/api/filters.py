@@ -1,15 +1,32 @@
+from django.conf import settings
+from django.db.models import Case, IntegerField, Value, When
 from django_filters.rest_framework import BooleanFilter, FilterSet, filters
 
 from users.models import Ingredient, Recipe, Tag
 
 
 class IngredientFilter(FilterSet):
-    name = filters.CharFilter(lookup_expr='istartswith')
+    name = filters.CharFilter(method='filter_name')
 
     class Meta:
         model = Ingredient
         fields = ('name',)
 
+    def filter_name(self, queryset, name, value):
+        """Ищет по началу названия или, в режиме contains, по подстроке.
+
+        В режиме contains совпадения с начала названия идут первыми.
+        """
+        if settings.INGREDIENT_SEARCH_MODE != 'contains':
+            return queryset.filter(name__istartswith=value)
+        return queryset.filter(name__icontains=value).annotate(
+            is_prefix_match=Case(
+                When(name__istartswith=value, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField(),
+            )
+        ).order_by('is_prefix_match', 'name')
+
 
 class RecipeFilter(FilterSet):
     tags = filters.ModelMultipleChoiceFilter(
@@ -19,10 +36,22 @@ class RecipeFilter(FilterSet):
     )
     is_favorited = BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = BooleanFilter(method='filter_is_in_shopping_cart')
+    search = filters.CharFilter(method='filter_search')
+    ingredients = filters.ModelMultipleChoiceFilter(
+        queryset=Ingredient.objects.all(),
+        method='filter_ingredients',
+    )
+    exclude_ingredients = filters.ModelMultipleChoiceFilter(
+        queryset=Ingredient.objects.all(),
+        method='filter_exclude_ingredients',
+    )
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+            'search', 'ingredients', 'exclude_ingredients',
+        )
 
     def filter_is_favorited(self, queryset, name, value):
         """Фильтрует queryset по избранным рецептам."""
@@ -35,3 +64,28 @@ class RecipeFilter(FilterSet):
         if value and self.request.user.is_authenticated:
             return queryset.filter(shopping_list__user=self.request.user)
         return queryset
+
+    def filter_ingredients(self, queryset, name, value):
+        """Оставляет рецепты, в которых есть все указанные ингредиенты."""
+        if not value:
+            return queryset
+        return queryset.with_ingredients(
+            ingredient.pk for ingredient in value
+        )
+
+    def filter_exclude_ingredients(self, queryset, name, value):
+        """Убирает рецепты, в которых есть любой из указанных
+        ингредиентов."""
+        if not value:
+            return queryset
+        return queryset.without_ingredients(
+            ingredient.pk for ingredient in value
+        )
+
+    def filter_search(self, queryset, name, value):
+        """Ищет по названию, описанию и ингредиентам, лучшие совпадения
+        первыми.
+
+        Курсорная пагинация сохраняет свой порядок по id.
+        """
+        return queryset.search(value)
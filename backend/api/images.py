@@ -0,0 +1,140 @@
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PurePosixPath
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .caching import bump_recipe_data_version
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_VARIANT_WORKERS,
+    thread_name_prefix='image-variants',
+)
+
+
+class ImageProcessingError(ValueError):
+    """Загруженные данные не удалось принять как картинку."""
+
+
+def encode(image):
+    """Кодирует картинку в IMAGE_FORMAT без метаданных."""
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert(
+            'RGBA' if 'transparency' in image.info or 'A' in image.mode
+            else 'RGB'
+        )
+    buffer = io.BytesIO()
+    image.save(
+        buffer, settings.IMAGE_FORMAT, quality=settings.IMAGE_QUALITY
+    )
+    return buffer.getvalue()
+
+
+def check_upload_size(size):
+    """Отклоняет файлы больше MAX_IMAGE_UPLOAD_SIZE байт."""
+    if size > settings.MAX_IMAGE_UPLOAD_SIZE:
+        raise ImageProcessingError(
+            'Размер файла больше '
+            f'{settings.MAX_IMAGE_UPLOAD_SIZE // (1024 * 1024)} МБ'
+        )
+
+
+def process_upload(raw):
+    """Проверяет загруженную картинку и перекодирует её.
+
+    Отклоняет файлы больше MAX_IMAGE_UPLOAD_SIZE байт и картинки больше
+    MAX_IMAGE_PIXELS пикселей, поворачивает по EXIF, уменьшает до
+    IMAGE_MAX_SIDE по большей стороне и сохраняет в IMAGE_FORMAT без
+    метаданных.
+
+    Возвращает ContentFile, готовый для ImageField.
+    """
+    check_upload_size(len(raw))
+    try:
+        image = Image.open(io.BytesIO(raw))
+        width, height = image.size
+        if width * height > settings.MAX_IMAGE_PIXELS:
+            raise ImageProcessingError(
+                f'Картинка больше {settings.MAX_IMAGE_PIXELS} пикселей'
+            )
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(
+            (settings.IMAGE_MAX_SIDE, settings.IMAGE_MAX_SIDE),
+            Image.Resampling.LANCZOS,
+        )
+        content = encode(image)
+    except (UnidentifiedImageError, Image.DecompressionBombError,
+            OSError) as error:
+        raise ImageProcessingError(error) from error
+    return ContentFile(
+        content, name=f'image.{settings.IMAGE_FORMAT.lower()}'
+    )
+
+
+def variant_name(name, variant):
+    """Путь файла варианта рядом с оригиналом."""
+    path = PurePosixPath(name)
+    return str(
+        path.parent / 'variants'
+        / f'{path.stem}_{variant}.{settings.IMAGE_FORMAT.lower()}'
+    )
+
+
+def build_variants(model_label, pk, field_name, kind):
+    """Создаёт варианты картинки и сохраняет их пути в <поле>_variants.
+
+    Пути записываются, только если картинка не сменилась за время работы.
+    """
+    model = apps.get_model(model_label)
+    try:
+        instance = model.objects.filter(pk=pk).first()
+        file = getattr(instance, field_name, None)
+        if not file:
+            return
+        source = file.name
+        with file.open('rb'):
+            image = Image.open(file)
+            image.load()
+        variants = {'source': source}
+        for variant, (width, height, crop) in (
+            settings.IMAGE_VARIANTS[kind].items()
+        ):
+            if crop:
+                resized = ImageOps.fit(
+                    image, (width, height), Image.Resampling.LANCZOS
+                )
+            else:
+                resized = image.copy()
+                resized.thumbnail((width, height), Image.Resampling.LANCZOS)
+            name = variant_name(source, variant)
+            file.storage.delete(name)
+            variants[variant] = file.storage.save(
+                name, ContentFile(encode(resized))
+            )
+        if model.objects.filter(pk=pk, **{field_name: source}).update(
+            **{f'{field_name}_variants': variants}
+        ):
+            bump_recipe_data_version()
+    except Exception:
+        logger.exception(
+            'Не удалось создать варианты картинки %s %s', model_label, pk
+        )
+    finally:
+        if settings.IMAGE_VARIANTS_ASYNC:
+            connections.close_all()
+
+
+def schedule_variants(instance, field_name, kind):
+    """Ставит создание вариантов в фоновый поток после коммита."""
+    args = (instance._meta.label, instance.pk, field_name, kind)
+    if settings.IMAGE_VARIANTS_ASYNC:
+        transaction.on_commit(lambda: executor.submit(build_variants, *args))
+    else:
+        transaction.on_commit(lambda: build_variants(*args))
@@ -0,0 +1,93 @@
+import bisect
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+
+from users.models import Ingredient
+
+INDEX_VERSION_CACHE_KEY = 'ingredient_index_state'
+MAX_CHAR = chr(0x10FFFF)
+
+
+class IngredientPrefixIndex:
+    """
+    Индекс ингредиентов в памяти процесса для поиска по началу названия
+    Хранит названия, приведённые через casefold, в отсортированном массиве;
+    поиск по префиксу сводится к двум бинарным поискам. Строится лениво
+    при первом обращении и перестраивается после изменения ингредиентов.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+
+    def invalidate(self):
+        """Сбрасывает индекс во всех процессах, разделяющих кеш."""
+        self._state = None
+        cache.set(INDEX_VERSION_CACHE_KEY, self._new_version(), None)
+
+    def get_version(self):
+        """Версия справочника ингредиентов и время её смены (timestamp)."""
+        version = cache.get(INDEX_VERSION_CACHE_KEY)
+        if version is None:
+            cache.add(INDEX_VERSION_CACHE_KEY, self._new_version(), None)
+            version = cache.get(INDEX_VERSION_CACHE_KEY)
+        return version
+
+    async def aget_version(self):
+        """Асинхронный вариант get_version."""
+        version = await cache.aget(INDEX_VERSION_CACHE_KEY)
+        if version is None:
+            await cache.aadd(
+                INDEX_VERSION_CACHE_KEY, self._new_version(), None
+            )
+            version = await cache.aget(INDEX_VERSION_CACHE_KEY)
+        return version
+
+    def search(self, prefix=''):
+        """Ингредиенты, название которых начинается с prefix.
+
+        Порядок и формат совпадают с IngredientInfoSerializer
+        для Ingredient.objects.filter(name__istartswith=prefix).
+        """
+        rows, keys, positions = self._get_state()
+        if not prefix:
+            return rows
+        key = prefix.casefold()
+        start = bisect.bisect_left(keys, key)
+        end = bisect.bisect_right(keys, key + MAX_CHAR, lo=start)
+        return [rows[position] for position in sorted(positions[start:end])]
+
+    def _get_state(self):
+        version = self.get_version()
+        state = self._state
+        if state is None or state[0] != version:
+            with self._lock:
+                state = self._state
+                if state is None or state[0] != version:
+                    state = self._state = (version, *self._build())
+        return state[1:]
+
+    def _new_version(self):
+        return uuid.uuid4().hex, int(time.time())
+
+    def _build(self):
+        # Индекс живёт до следующей смены версии, поэтому строится по
+        # основной базе, а не по возможно отстающей реплике.
+        rows = list(
+            Ingredient.objects.using('default').values(
+                'id', 'name', 'measurement_unit'
+            )
+        )
+        entries = sorted(
+            (row['name'].casefold(), position)
+            for position, row in enumerate(rows)
+        )
+        keys = [key for key, _ in entries]
+        positions = [position for _, position in entries]
+        return rows, keys, positions
+
+
+ingredient_index = IngredientPrefixIndex()
@@ -0,0 +1,192 @@
+import hashlib
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from .db_routers import (get_sticky_key, is_sticky, stick_to_primary,
+                         use_replica)
+
+logger = logging.getLogger(__name__)
+
+current_stats = ContextVar('query_stats', default=None)
+
+LITERALS_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+IN_LIST_RE = re.compile(r'\bIN \((?:\?, )*\?\)')
+
+
+class QueryBudgetExceeded(Exception):
+    """Запрос к API выполнил больше SQL-запросов, чем позволяет бюджет."""
+
+
+def fingerprint(sql):
+    """Текст SQL без литералов: одинаковый для запросов в цикле."""
+    sql = IN_LIST_RE.sub('IN (...)', LITERALS_RE.sub('?', sql))
+    return hashlib.md5(sql.encode()).hexdigest()[:8]
+
+
+class QueryStats:
+    """Обёртка выполнения SQL, собирающая статистику запроса."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.monotonic() - started
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    @property
+    def duplicates(self):
+        return {
+            key: count for key, count in self.fingerprints.most_common()
+            if count > 1
+        }
+
+
+def record_query(execute, sql, params, many, context):
+    """Учитывает запрос в статистике текущего HTTP-запроса, если она
+    собирается."""
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def install_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class QueryBudgetMiddleware:
+    """
+    Счётчик SQL-запросов на HTTP-запрос
+    Количество запросов, время в базе и повторяющиеся запросы (отпечатки
+    SQL без литералов) возвращаются в заголовках X-DB-*. Если маршрут
+    превысил бюджет из QUERY_BUDGETS, пишется предупреждение, а при
+    QUERY_BUDGET_STRICT выбрасывается QueryBudgetExceeded
+    Статистика привязана к контексту запроса, поэтому учитываются и
+    запросы асинхронного ORM из потоков sync_to_async. Запросы, выполняемые
+    при отдаче потокового ответа, не учитываются
+    """
+
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        if not settings.QUERY_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        connection_created.connect(install_recorder)
+        for connection in connections.all(initialized_only=True):
+            install_recorder(None, connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = QueryStats()
+        token = current_stats.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.report(request, response, stats)
+
+    async def __acall__(self, request):
+        stats = QueryStats()
+        token = current_stats.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.report(request, response, stats)
+
+    def report(self, request, response, stats):
+        response['X-DB-Query-Count'] = stats.count
+        response['X-DB-Time-Ms'] = f'{stats.duration * 1000:.1f}'
+        duplicates = stats.duplicates
+        if duplicates:
+            response['X-DB-Duplicate-Queries'] = ', '.join(
+                f'{key}={count}' for key, count in duplicates.items()
+            )
+
+        match = request.resolver_match
+        budget = match and settings.QUERY_BUDGETS.get(
+            (request.method, match.url_name)
+        )
+        if budget is not None:
+            response['X-DB-Query-Budget'] = budget
+            if stats.count > budget:
+                message = (
+                    f'{request.method} {match.url_name}: {stats.count} '
+                    f'SQL-запросов при бюджете {budget}'
+                )
+                if settings.QUERY_BUDGET_STRICT:
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Разрешает чтение с реплик для безопасных запросов к API
+    Клиент, который недавно выполнил запрос на запись, читает с основной
+    базы, пока реплики не догнали её (read-your-writes)
+    """
+
+    async_capable = True
+    sync_capable = True
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        if not settings.REPLICA_DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        key, token = self.route(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            use_replica.reset(token)
+        return self.finish(request, key, response)
+
+    async def __acall__(self, request):
+        key, token = self.route(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            use_replica.reset(token)
+        return self.finish(request, key, response)
+
+    def route(self, request):
+        key = get_sticky_key(request)
+        return key, use_replica.set(
+            request.method in self.safe_methods
+            and request.path.startswith('/api/')
+            and not is_sticky(key)
+        )
+
+    def finish(self, request, key, response):
+        if request.method not in self.safe_methods and key is not None:
+            stick_to_primary(key)
+        return response
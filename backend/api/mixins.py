@@ -1,14 +1,108 @@
-from django.db.models import Count
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Prefetch, Value
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
 
+from django.core.cache import cache
 from rest_framework import status
 from rest_framework.response import Response
 
 from users.models import Follow, Recipe, User
 
+from .caching import (get_recipe_data_version, get_response_cache_key,
+                      get_response_cache_timeout, get_validators,
+                      set_validators)
 from .serializers import SubscriptionSerializer
 
 
+class ConditionalGetMixin:
+    """
+    Миксин условных GET-запросов для list и retrieve
+    ETag считается по версии данных ответа из кеша, Last-Modified — по
+    времени её смены; если они совпадают с присланными клиентом,
+    возвращается 304 без запросов к базе и сериализации данных
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def filter_lookup(self, queryset):
+        """Объект из адреса; неверное значение — 404, как в get_object."""
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            return queryset.filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+
+    def get_data_version(self, request):
+        """Версия данных ответа; теги, ингредиенты и авторы меняют версию
+        данных рецептов."""
+        return get_recipe_data_version()
+
+    def get_last_modified(self, request):
+        """Время изменения данных ответа (timestamp) или None."""
+        return None
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        """Отвечает 304 или дополняет ответ 200 заголовками ETag и
+        Last-Modified."""
+        if self.action == 'retrieve':
+            self.filter_lookup(self.get_queryset())
+        etag, last_modified = get_validators(
+            request, self.get_data_version(request),
+            self.get_last_modified(request),
+        )
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        return set_validators(response, etag, last_modified)
+
+
+class AnonymousCacheMixin:
+    """
+    Миксин кеширования list и retrieve для анонимных пользователей
+    Ключ включает версию данных рецептов, поэтому любое изменение
+    рецептов, тегов, ингредиентов или пользователей сбрасывает кеш целиком
+    """
+
+    cache_timeout = settings.RECIPE_CACHE_TIMEOUT
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        """Отдаёт ответ из кеша или сохраняет в кеш новый."""
+        if not request.user.is_anonymous:
+            return handler(request, *args, **kwargs)
+        key = get_response_cache_key(request, f'{self.basename}:{self.action}')
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(
+                key, response.data,
+                get_response_cache_timeout(self.cache_timeout),
+            )
+        return response
+
+
 class RecipeActionMixin:
     """
     Миксин для обработки действий с рецептами
@@ -105,10 +199,28 @@ class SubscriptionMixin:
             )
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def get_subscriptions_queryset(self, user):
+        """
+        Авторы, на которых подписан пользователь
+        Последние recipes_limit рецептов всех авторов страницы
+        подгружаются одним запросом с оконной функцией
+        """
+        limit = int(self.request.GET.get('recipes_limit',
+                                         settings.DEFAULT_PAGE_SIZE))
+        return User.objects.filter(follower__user=user).annotate(
+            is_subscribed=Value(True),
+        ).prefetch_related(
+            Prefetch(
+                'recipes',
+                queryset=Recipe.objects.all()[:limit],
+                to_attr='limited_recipes',
+            )
+        )
+
     def _get_subscription_response(self, author):
         """Формирование ответа с данными подписки"""
-        author_data = User.objects.annotate(
-            recipes_count=Count('recipes')).get(id=author.id)
+        author_data = self.get_subscriptions_queryset(
+            self.request.user).get(id=author.id)
         serializer = SubscriptionSerializer(
             author_data, context={'request': self.request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -1,7 +1,48 @@
 from django.conf import settings
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
-class CustomLimitPagination(PageNumberPagination):
+class CustomCursorPagination(CursorPagination):
+    """Курсорная пагинация по Recipe.Meta.ordering без подсчёта COUNT(*)."""
+
+    ordering = '-id'
+    page_size_query_param = 'limit'
+    page_size = settings.DEFAULT_PAGE_SIZE
+
+
+class PageLimitPagination(PageNumberPagination):
+    """Постраничная пагинация с параметром limit."""
+
     page_size_query_param = 'limit'
     page_size = settings.DEFAULT_PAGE_SIZE
+
+
+class CustomLimitPagination(PageLimitPagination):
+    """
+    Постраничная пагинация с параметром limit
+    Запрос с pagination=cursor или cursor=<...> переключает её в курсорный
+    режим: страницы выбираются по ключу, без COUNT(*) и OFFSET
+    """
+
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    cursor_paginator = None
+
+    def use_cursor(self, request):
+        return (
+            self.cursor_query_param in request.query_params
+            or request.query_params.get(self.mode_query_param) == 'cursor'
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request):
+            self.cursor_paginator = CustomCursorPagination()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
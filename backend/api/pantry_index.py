@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from users.models import Recipe
+
+# Запас для выборки изменённых рецептов: транзакция, начатая до снимка,
+# может зафиксироваться после него с более ранним updated_at.
+SNAPSHOT_OVERLAP = timedelta(minutes=1)
+
+Snapshot = namedtuple(
+    'Snapshot', 'built since recipe_ids bounds ingredients columns'
+)
+
+
+class PantryIndex:
+    """
+    Индекс рецептов в памяти процесса для подбора по имеющимся ингредиентам
+    Снимок Recipe.ingredient_ids хранится в разреженном построчном виде:
+    id рецептов по возрастанию, границы их строк и номера ингредиентов.
+    Подбор — несколько векторных операций numpy сразу над всеми рецептами.
+    Рецепты, изменённые после снимка, при каждом подборе читаются из базы
+    по индексу updated_at; снимок перестраивается, когда их больше
+    PANTRY_INDEX_MAX_DELTA или он старше PANTRY_INDEX_MAX_AGE секунд.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+
+    def match(self, ingredient_ids, max_missing=0, limit=None):
+        """Рецепты, которым не хватает не больше max_missing ингредиентов.
+
+        Возвращает список (id рецепта, есть ингредиентов, всего
+        ингредиентов): сначала с меньшим числом недостающих, затем с
+        большей долей имеющихся, затем новые. Рецепты, для которых нет ни
+        одного ингредиента, не возвращаются.
+        """
+        pantry = np.unique(np.asarray(list(ingredient_ids), dtype=np.int64))
+        state, changed = self._get_state()
+
+        have = np.zeros(len(state.ingredients), dtype=bool)
+        have[np.searchsorted(
+            state.ingredients, pantry[np.isin(pantry, state.ingredients)]
+        )] = True
+        hits = np.concatenate((
+            [0], np.cumsum(have[state.columns], dtype=np.int32)
+        ))
+        matched = hits[state.bounds[1:]] - hits[state.bounds[:-1]]
+        sizes = np.diff(state.bounds)
+        selected = (matched > 0) & (sizes - matched <= max_missing)
+        if changed:
+            selected &= ~np.isin(
+                state.recipe_ids, np.fromiter(changed, dtype=np.int64)
+            )
+        recipe_ids = state.recipe_ids[selected]
+        matched = matched[selected]
+        sizes = sizes[selected]
+
+        pantry = set(pantry.tolist())
+        extra = [
+            (recipe_id, len(pantry.intersection(ids)), len(ids))
+            for recipe_id, ids in changed.items() if ids
+        ]
+        extra = [
+            row for row in extra if row[1] and row[2] - row[1] <= max_missing
+        ]
+        if extra:
+            extra_ids, extra_matched, extra_sizes = zip(*extra)
+            recipe_ids = np.concatenate((recipe_ids, extra_ids))
+            matched = np.concatenate((matched, extra_matched))
+            sizes = np.concatenate((sizes, extra_sizes))
+        matched = matched.astype(np.int64)
+        sizes = sizes.astype(np.int64)
+
+        missing = sizes - matched
+        # Один ключ сортировки вместо lexsort: число недостающих, затем
+        # размер рецепта (при равном числе недостающих доля имеющихся
+        # растёт с размером), затем id. id не длиннее 40 бит, как и в
+        # коротких ссылках.
+        keys = (
+            (missing << 56)
+            - (np.where(missing > 0, sizes, 0) << 40)
+            - recipe_ids
+        )
+        if limit is not None and limit < len(keys):
+            top = np.argpartition(keys, limit)[:limit]
+            order = top[np.argsort(keys[top])]
+        else:
+            order = np.argsort(keys)
+        return list(zip(
+            recipe_ids[order].tolist(),
+            matched[order].tolist(),
+            sizes[order].tolist(),
+        ))
+
+    def _get_state(self):
+        state = self._state
+        if (
+            state is not None
+            and time.monotonic() - state.built < settings.PANTRY_INDEX_MAX_AGE
+        ):
+            changed = self._load_changed(state.since)
+            if len(changed) <= settings.PANTRY_INDEX_MAX_DELTA:
+                return state, changed
+        with self._lock:
+            if self._state is state:
+                self._state = self._build()
+            state = self._state
+        return state, self._load_changed(state.since)
+
+    def _load_changed(self, since):
+        return dict(
+            Recipe.objects.using('default').filter(
+                updated_at__gte=since
+            ).values_list('id', 'ingredient_ids')
+        )
+
+    def _build(self):
+        # Снимок живёт минуты, поэтому строится по основной базе, а не по
+        # возможно отстающей реплике.
+        since = timezone.now() - SNAPSHOT_OVERLAP
+        recipe_ids = []
+        sizes = [0]
+        values = []
+        rows = Recipe.objects.using('default').exclude(
+            ingredient_ids=None
+        ).order_by('id').values_list('id', 'ingredient_ids')
+        for recipe_id, ids in rows.iterator(chunk_size=10_000):
+            recipe_ids.append(recipe_id)
+            sizes.append(len(ids))
+            values.extend(ids)
+        ingredients, columns = np.unique(
+            np.asarray(values, dtype=np.int64), return_inverse=True
+        )
+        return Snapshot(
+            built=time.monotonic(),
+            since=since,
+            recipe_ids=np.asarray(recipe_ids, dtype=np.int64),
+            bounds=np.cumsum(sizes),
+            ingredients=ingredients,
+            columns=columns,
+        )
+
+
+pantry_index = PantryIndex()
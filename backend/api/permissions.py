@@ -9,5 +9,5 @@ class IsAdminOrAuthorOrReadOnly(permissions.IsAuthenticatedOrReadOnly):
         return (
             request.method in permissions.SAFE_METHODS
             or request.user.is_superuser
-            or obj.author == request.user
+            or obj.author_id == request.user.id
         )
@@ -15,6 +15,8 @@ from .recipe_serializers import (
     RecipeCreateSerializer,
     RecipeInfoSerializer,
     RecipeBriefInfoSerializer,
+    PantryRecipeSerializer,
+    PantryQuerySerializer,
     IngredientInfoSerializer,
     TagInfoSerializer,
 )
@@ -1,8 +1,10 @@
 import base64
 
-from django.core.files.base import ContentFile
+from django.conf import settings
 from rest_framework import serializers
 
+from ..images import check_upload_size, process_upload
+
 
 class CustomImageField(serializers.ImageField):
     def to_internal_value(self, data):
@@ -13,13 +15,56 @@ class CustomImageField(serializers.ImageField):
             raise serializers.ValidationError(
                 "Ожидается строка, содержащая base64 данные изображения")
 
+        current = self.get_current_file()
+        if current and data == self.to_representation(current):
+            return current
+
         try:
             if data.startswith('data:image'):
-                format, imgstr = data.split(';base64,')
-                ext = format.split('/')[-1]
-                data = ContentFile(base64.b64decode(imgstr),
-                                   name='temp.' + ext)
+                _, imgstr = data.split(';base64,')
+                check_upload_size(len(imgstr) * 3 // 4)
+                data = process_upload(base64.b64decode(imgstr))
             return super().to_internal_value(data)
         except (ValueError, TypeError, OSError, base64.binascii.Error) as e:
             raise serializers.ValidationError(
                 f"Некорректные base64 данные изображения: {e}")
+
+    def get_current_file(self):
+        """Текущий файл поля у редактируемого объекта, если он есть."""
+        instance = getattr(self.parent, 'instance', None)
+        if instance is None or isinstance(instance, (list, tuple)):
+            return None
+        return getattr(instance, self.source, None)
+
+
+class ImageVariantsField(serializers.Field):
+    """
+    URL вариантов картинки из IMAGE_VARIANTS
+    Пока варианты не созданы, для них отдаётся URL оригинала
+    """
+
+    def __init__(self, image_field, kind, **kwargs):
+        self.image_field = image_field
+        self.kind = kind
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        image = getattr(instance, self.image_field)
+        if not image:
+            return None
+        variants = getattr(instance, f'{self.image_field}_variants') or {}
+        if variants.get('source') != image.name:
+            variants = {}
+        request = self.context.get('request')
+        result = {}
+        for variant in settings.IMAGE_VARIANTS[self.kind]:
+            url = (
+                image.storage.url(variants[variant]) if variant in variants
+                else image.url
+            )
+            result[variant] = (
+                request.build_absolute_uri(url) if request else url
+            )
+        return result
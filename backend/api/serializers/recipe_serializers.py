@@ -1,23 +1,27 @@
+from django.conf import settings
 from djoser.serializers import UserSerializer
 from django.db import transaction
 from rest_framework import serializers
 
-from users.models import (Favorite, Ingredient, Recipe, RecipeToIngredient,
-                          ShoppingList, Tag, User)
+from users.models import (Ingredient, Recipe, RecipeToIngredient,
+                          ShoppingCartIngredient, Tag, User)
 
-from .avatar_serializers import CustomImageField
+from ..utils import get_subscribed_author_ids
+from .avatar_serializers import CustomImageField, ImageVariantsField
 
 
 class UserProfileSerializer(UserSerializer):
     """Сериализатор для представления информации о пользователе."""
 
     avatar = CustomImageField(required=False, allow_null=True)
+    avatar_variants = ImageVariantsField('avatar', 'avatar')
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta(UserSerializer.Meta):
         model = User
         fields = (
             'avatar',
+            'avatar_variants',
             'email',
             'first_name',
             'id',
@@ -25,14 +29,14 @@ class UserProfileSerializer(UserSerializer):
             'last_name',
             'username',
         )
-        read_only_fields = ('id', 'is_subscribed')
+        read_only_fields = ('avatar_variants', 'id', 'is_subscribed')
 
     def get_is_subscribed(self, obj):
         """Определяет, подписан ли текущий пользователь на автора."""
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
-        return request.user.follower.filter(author=obj).exists()
+        return obj.id in get_subscribed_author_ids(request)
 
 
 class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
@@ -67,8 +71,8 @@ class RecipeIngredientInfoSerializer(serializers.ModelSerializer):
 class RecipeCreateSerializer(serializers.ModelSerializer):
     """Сериализатор для создания рецепта."""
 
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(), many=True, label='Tags'
+    tags = serializers.ListField(
+        child=serializers.IntegerField(), label='Tags'
     )
     ingredients = RecipeIngredientCreateSerializer(
         many=True, label='Ingredients'
@@ -111,26 +115,120 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         RecipeToIngredient.objects.bulk_create(result)
 
     def create_tags(self, tags, recipe):
-        """Устанавливает теги для рецепта."""
-        recipe.tags.set(tags)
+        """Устанавливает теги для нового рецепта."""
+        recipe.tags.add(*tags)
 
     def to_representation(self, instance):
         """Возвращает полное представление рецепта."""
+        request = self.context.get('request')
+        instance = Recipe.objects.with_related().with_user_flags(
+            request.user
+        ).get(pk=instance.pk)
         serializer = RecipeInfoSerializer(
-            instance, context={'request': self.context.get('request')}
+            instance, context={'request': request}
         )
         return serializer.data
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        """Обновляет существующий рецепт."""
+        """Обновляет существующий рецепт.
+
+        Изменения ингредиентов, тегов и полей рецепта вычисляются
+        относительно текущего состояния: в базу уходят только нужные
+        INSERT, UPDATE и DELETE, неизменённая картинка не перезаписывается.
+        """
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
-        instance.ingredients.clear()
-        instance.tags.clear()
-        RecipeToIngredient.objects.filter(recipe=instance).delete()
-        self.create_ingredients(ingredients, instance)
-        self.create_tags(tags, instance)
-        return super().update(instance, validated_data)
+        relations_changed = any((
+            self.update_ingredients(ingredients, instance),
+            self.update_tags(tags, instance),
+        ))
+        if 'image' in validated_data and self.is_same_image(
+            instance.image, validated_data['image']
+        ):
+            del validated_data['image']
+        changed_fields = [
+            field for field, value in validated_data.items()
+            if getattr(instance, field) != value
+        ]
+        for field in changed_fields:
+            setattr(instance, field, validated_data[field])
+        if changed_fields or relations_changed:
+            instance.save(update_fields=[*changed_fields, 'updated_at'])
+        return instance
+
+    def update_ingredients(self, ingredients, recipe):
+        """Приводит ингредиенты рецепта к новому списку по разнице."""
+        current = {item.ingredient_id: item
+                   for item in recipe.ingredient_list.all()}
+        new_amounts = {
+            int(ingredient['id']): int(ingredient['amount'])
+            for ingredient in ingredients
+        }
+        deleted = [item.id for ingredient_id, item in current.items()
+                   if ingredient_id not in new_amounts]
+        created = []
+        updated = []
+        deltas = {ingredient_id: -current[ingredient_id].amount
+                  for ingredient_id in current.keys() - new_amounts.keys()}
+        for ingredient_id, amount in new_amounts.items():
+            item = current.get(ingredient_id)
+            if item is None:
+                created.append(RecipeToIngredient(
+                    ingredient_id=ingredient_id, recipe=recipe, amount=amount
+                ))
+                deltas[ingredient_id] = amount
+            elif item.amount != amount:
+                deltas[ingredient_id] = amount - item.amount
+                item.amount = amount
+                updated.append(item)
+        if deleted:
+            RecipeToIngredient.objects.filter(id__in=deleted).delete()
+        if updated:
+            RecipeToIngredient.objects.bulk_update(updated, ('amount',))
+        if created:
+            RecipeToIngredient.objects.bulk_create(created)
+        if deltas:
+            ShoppingCartIngredient.objects.apply_deltas(recipe, deltas)
+        return bool(deltas)
+
+    def update_tags(self, tags, recipe):
+        """Приводит теги рецепта к новому списку по разнице."""
+        current = set(recipe.tags.values_list('id', flat=True))
+        new = {int(tag) for tag in tags}
+        if current == new:
+            return False
+        recipe.tags.remove(*current - new)
+        recipe.tags.add(*new - current)
+        return True
+
+    def is_same_image(self, current, image):
+        """Проверяет, совпадает ли загруженная картинка с текущей."""
+        if not current:
+            return False
+        if image is current or getattr(image, 'name', None) == current.name:
+            return True
+        try:
+            if image.size != current.size:
+                return False
+            image.seek(0)
+            with current.open('rb') as file:
+                return file.read() == image.read()
+        except (AttributeError, OSError):
+            return False
+        finally:
+            if hasattr(image, 'seek'):
+                image.seek(0)
+
+    def validate_tags(self, tags):
+        """Проверяет существование тегов одним запросом."""
+        missing_ids = set(tags) - set(
+            Tag.objects.filter(id__in=tags).values_list('id', flat=True)
+        )
+        if missing_ids:
+            raise serializers.ValidationError(
+                f'Тег с id: {missing_ids} не существует !')
+        return tags
 
     def validate(self, data):
         """Валидирует данные рецепта."""
@@ -171,11 +269,12 @@ class RecipeInfoSerializer(serializers.ModelSerializer):
     """Сериализатор для отображения информации о рецепте."""
 
     author = UserProfileSerializer()
+    image_variants = ImageVariantsField('image', 'recipe')
     ingredients = RecipeIngredientInfoSerializer(
         source='ingredient_list', many=True
     )
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
+    is_favorited = serializers.BooleanField(read_only=True)
+    is_in_shopping_cart = serializers.BooleanField(read_only=True)
     tags = TagInfoSerializer(many=True)
 
     class Meta:
@@ -185,6 +284,7 @@ class RecipeInfoSerializer(serializers.ModelSerializer):
             'cooking_time',
             'id',
             'image',
+            'image_variants',
             'ingredients',
             'is_favorited',
             'is_in_shopping_cart',
@@ -193,22 +293,61 @@ class RecipeInfoSerializer(serializers.ModelSerializer):
             'text',
         )
 
-    def check_user_status(self, obj, model_class):
-        request = self.context.get('request')
-        return (
-            request
-            and request.user.is_authenticated
-            and model_class.objects.filter(recipe=obj,
-                                           user=request.user).exists()
+
+class PantryRecipeSerializer(RecipeInfoSerializer):
+    """
+    Сериализатор рецепта, подобранного по имеющимся ингредиентам
+    Ожидает в контексте pantry — множество id имеющихся ингредиентов
+    """
+
+    coverage = serializers.SerializerMethodField()
+    missing_ingredients = serializers.SerializerMethodField()
+
+    class Meta(RecipeInfoSerializer.Meta):
+        fields = (
+            'author',
+            'cooking_time',
+            'coverage',
+            'id',
+            'image',
+            'image_variants',
+            'ingredients',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'missing_ingredients',
+            'name',
+            'tags',
+            'text',
+        )
+
+    def get_coverage(self, obj):
+        """Доля ингредиентов рецепта, которые уже есть."""
+        ingredients = obj.ingredient_list.all()
+        if not ingredients:
+            return 0
+        missing = len(self.get_missing_ingredients(obj))
+        return round(1 - missing / len(ingredients), 2)
+
+    def get_missing_ingredients(self, obj):
+        """id ингредиентов рецепта, которых нет."""
+        pantry = self.context['pantry']
+        return sorted(
+            item.ingredient_id for item in obj.ingredient_list.all()
+            if item.ingredient_id not in pantry
         )
 
-    def get_is_favorited(self, obj):
-        """Определяет, находится ли рецепт в списке избранного пользователя."""
-        return self.check_user_status(obj, Favorite)
 
-    def get_is_in_shopping_cart(self, obj):
-        """Определяет, находится ли рецепт в списке покупок пользователя."""
-        return self.check_user_status(obj, ShoppingList)
+class PantryQuerySerializer(serializers.Serializer):
+    """Параметры подбора рецептов по имеющимся ингредиентам."""
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.PANTRY_MAX_INGREDIENTS,
+    )
+    max_missing = serializers.IntegerField(
+        min_value=0, max_value=settings.PANTRY_MAX_MISSING, default=0
+    )
 
 
 class RecipeBriefInfoSerializer(serializers.ModelSerializer):
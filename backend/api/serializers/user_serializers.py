@@ -63,9 +63,10 @@ class SubscriptionCreateSerializer(serializers.ModelSerializer):
 class SubscriptionSerializer(serializers.ModelSerializer):
     """Сериализатор для отображения информации о подписке."""
 
-    is_subscribed = serializers.SerializerMethodField()
-    recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField()
+    is_subscribed = serializers.BooleanField(read_only=True)
+    recipes = RecipeBriefInfoSerializer(
+        source='limited_recipes', many=True, read_only=True
+    )
 
     class Meta:
         model = User
@@ -85,24 +86,10 @@ class SubscriptionSerializer(serializers.ModelSerializer):
             'first_name',
             'id',
             'last_name',
+            'recipes_count',
             'username',
         )
 
-    def get_is_subscribed(self, obj):
-        """Определяет, подписан ли текущий пользователь на автора."""
-        user = self.context.get('request').user
-        return Follow.objects.filter(author=obj, user=user).exists()
-
-    def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = int(request.GET.get('recipes_limit',
-                                    settings.DEFAULT_PAGE_SIZE))
-        return RecipeBriefInfoSerializer(
-            Recipe.objects.filter(author=obj)[:limit],
-            many=True,
-            context={'request': request},
-        ).data
-
 
 class FavoriteRecipeSerializer(serializers.ModelSerializer):
     class Meta:
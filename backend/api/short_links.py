@@ -0,0 +1,94 @@
+import string
+
+from django.conf import settings
+from django.core.cache import cache
+
+from users.models import Recipe
+
+ALPHABET = string.digits + string.ascii_letters
+BITS = 40
+MASK = (1 << BITS) - 1
+MULTIPLIER = 0x9E3779B97 | 1
+INVERSE = pow(MULTIPLIER, -1, 1 << BITS)
+SHIFT = BITS // 2
+CACHE_KEY = 'short_link:{}'
+
+
+def encode(pk):
+    """Короткий код рецепта: обратимая перестановка pk в base62.
+
+    Соседние pk дают непохожие коды, а хранить коды в базе не нужно.
+    """
+    if not 0 < pk <= MASK:
+        raise ValueError(f'pk {pk} вне диапазона коротких ссылок')
+    value = (pk * MULTIPLIER) & MASK
+    value ^= value >> SHIFT
+    value ^= settings.SHORT_LINK_KEY & MASK
+    code = ''
+    while value:
+        value, digit = divmod(value, len(ALPHABET))
+        code = ALPHABET[digit] + code
+    return code or ALPHABET[0]
+
+
+def decode(code):
+    """pk по короткому коду или None для некорректного кода."""
+    if not code or len(code) > 7 or any(c not in ALPHABET for c in code):
+        return None
+    value = 0
+    for char in code:
+        value = value * len(ALPHABET) + ALPHABET.index(char)
+    if value > MASK:
+        return None
+    value ^= settings.SHORT_LINK_KEY & MASK
+    value ^= value >> SHIFT
+    pk = (value * INVERSE) & MASK
+    return pk or None
+
+
+def recipe_exists(pk):
+    """Есть ли рецепт с таким pk; ответ кешируется, в том числе
+    отрицательный."""
+    key = CACHE_KEY.format(pk)
+    exists = cache.get(key)
+    if exists is None:
+        exists = Recipe.objects.filter(pk=pk).exists()
+        remember(pk, exists)
+    return exists
+
+
+async def arecipe_exists(pk):
+    """Асинхронный вариант recipe_exists."""
+    key = CACHE_KEY.format(pk)
+    exists = await cache.aget(key)
+    if exists is None:
+        exists = await Recipe.objects.filter(pk=pk).aexists()
+        await cache.aset(key, exists, get_timeout(exists))
+    return exists
+
+
+def get_timeout(exists):
+    return (
+        settings.SHORT_LINK_CACHE_TIMEOUT if exists
+        else settings.SHORT_LINK_NEGATIVE_CACHE_TIMEOUT
+    )
+
+
+def remember(pk, exists):
+    cache.set(CACHE_KEY.format(pk), exists, get_timeout(exists))
+
+
+def resolve(code):
+    """pk рецепта по короткому коду или None, если рецепта нет."""
+    pk = decode(code)
+    if pk is None or not recipe_exists(pk):
+        return None
+    return pk
+
+
+async def aresolve(code):
+    """Асинхронный вариант resolve."""
+    pk = decode(code)
+    if pk is None or not await arecipe_exists(pk):
+        return None
+    return pk
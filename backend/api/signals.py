@@ -0,0 +1,92 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from users.models import (Favorite, Follow, Ingredient, Recipe,
+                          RecipeToIngredient, ShoppingList, Tag, User)
+
+from . import short_links
+from .caching import bump_recipe_data_version, bump_user_state_version
+from .images import schedule_variants
+from .ingredient_index import ingredient_index
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_ingredient_index(sender, using, **kwargs):
+    """Сбрасывает индекс ингредиентов после фиксации изменения справочника.
+
+    Сброс до фиксации позволил бы другому процессу перестроить индекс по
+    старым данным и сохранить его под новой версией.
+    """
+    transaction.on_commit(ingredient_index.invalidate, using=using)
+
+
+@receiver(post_save, sender=Recipe)
+def remember_short_link(sender, instance, created, using, **kwargs):
+    """Снимает отрицательный кеш короткой ссылки нового рецепта после
+    фиксации; откаченное создание кеш не меняет."""
+    if created:
+        pk = instance.pk
+        transaction.on_commit(
+            lambda: short_links.remember(pk, True), using=using
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def forget_short_link(sender, instance, using, **kwargs):
+    """Короткая ссылка удалённого рецепта перестаёт открываться сразу
+    после фиксации удаления."""
+    pk = instance.pk
+    transaction.on_commit(
+        lambda: short_links.remember(pk, False), using=using
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def create_recipe_image_variants(sender, instance, **kwargs):
+    """Ставит в очередь варианты новой картинки рецепта."""
+    if (instance.image
+            and instance.image_variants.get('source') != instance.image.name):
+        schedule_variants(instance, 'image', 'recipe')
+
+
+@receiver(post_save, sender=User)
+def create_avatar_variants(sender, instance, **kwargs):
+    """Ставит в очередь варианты нового фото профиля."""
+    if (instance.avatar
+            and instance.avatar_variants.get('source')
+            != instance.avatar.name):
+        schedule_variants(instance, 'avatar', 'avatar')
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+@receiver(post_save, sender=RecipeToIngredient)
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Ingredient)
+@receiver([post_save, post_delete], sender=User)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_responses(sender, using, update_fields=None,
+                                **kwargs):
+    """Меняет версию данных рецептов после фиксации, сбрасывая кеш ответов.
+
+    Смена версии до фиксации позволила бы запросу, прочитавшему старые
+    строки, закешировать их под новой версией. Удаление ингредиентов
+    рецепта сопровождается сохранением или удалением самого рецепта либо
+    удалением ингредиента: обработчик post_delete для RecipeToIngredient
+    лишь заставил бы Django выбирать строки перед каждым DELETE.
+    """
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    transaction.on_commit(bump_recipe_data_version, using=using)
+
+
+@receiver([post_save, post_delete], sender=Favorite)
+@receiver([post_save, post_delete], sender=ShoppingList)
+@receiver([post_save, post_delete], sender=Follow)
+def invalidate_user_state(sender, instance, using, **kwargs):
+    """Меняет версию состояния пользователя для ETag его ответов после
+    фиксации, как и версию данных рецептов."""
+    user_id = instance.user_id
+    transaction.on_commit(
+        lambda: bump_user_state_version(user_id), using=using
+    )
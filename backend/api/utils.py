@@ -1,13 +1,81 @@
-def generate_shopping_list(ingredients):
-    """Генерация текстового списка покупок.
+import csv
+import json
 
-    Принимает QuerySet ингредиентов с аннотацией sum.
+from users.models import Follow
 
-    Возвращает форматированную строку.
+SHOPPING_LIST_TITLE = 'Суммированный список ингредиентов:'
+SHOPPING_LIST_CSV_HEADER = ('Ингредиент', 'Количество', 'Единица измерения')
+
+
+def get_subscribed_author_ids(request):
+    """Множество id авторов, на которых подписан текущий пользователь.
+
+    Загружается одним запросом и кешируется на объекте запроса, поэтому
+    вложенные сериализаторы авторов не обращаются к базе повторно.
+    """
+    author_ids = getattr(request, '_subscribed_author_ids', None)
+    if author_ids is None:
+        author_ids = set(
+            Follow.objects.filter(user=request.user).values_list(
+                'author_id', flat=True
+            )
+        )
+        request._subscribed_author_ids = author_ids
+    return author_ids
+
+
+class Echo:
+    """Псевдобуфер: csv.writer сразу возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def shopping_list_txt(ingredients):
+    yield f'{SHOPPING_LIST_TITLE}\n'
+    for ingredient in ingredients:
+        yield (
+            f'{ingredient["ingredient__name"]} - {ingredient["sum"]} '
+            f'({ingredient["ingredient__measurement_unit"]})\n'
+        )
+
+
+def shopping_list_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(SHOPPING_LIST_CSV_HEADER)
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['sum'],
+            ingredient['ingredient__measurement_unit'],
+        ))
+
+
+def shopping_list_json(ingredients):
+    yield '['
+    for number, ingredient in enumerate(ingredients):
+        yield (',' if number else '') + json.dumps({
+            'name': ingredient['ingredient__name'],
+            'amount': ingredient['sum'],
+            'measurement_unit': ingredient['ingredient__measurement_unit'],
+        }, ensure_ascii=False)
+    yield ']'
+
+
+SHOPPING_LIST_WRITERS = {
+    'txt': shopping_list_txt,
+    'csv': shopping_list_csv,
+    'json': shopping_list_json,
+}
+
+
+def generate_shopping_list(ingredients, file_format='txt'):
+    """Потоковая генерация списка покупок.
+
+    Принимает итератор ингредиентов с аннотацией sum и формат файла:
+    txt, csv или json.
+
+    Возвращает генератор фрагментов файла: заголовок отдаётся до того,
+    как будет выполнен запрос к базе.
     """
-    return '\n'.join(
-        'Суммированный список ингридиентов:'
-        f'{ingridient["ingredient__name"]} - {ingridient["sum"]} '
-        f'({ingridient["ingredient__measurement_unit"]})'
-        for ingridient in ingredients
-    )
+    return SHOPPING_LIST_WRITERS[file_format](ingredients)
@@ -1,35 +1,48 @@
-from django.db.models import Count, Sum
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404, redirect
+from django.conf import settings
+from django.db.models import F
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import redirect
 from django.views.decorators.http import require_GET
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
-from users.models import (Favorite, Ingredient, Recipe, RecipeToIngredient,
-                          ShoppingList, Tag, User)
+from users.models import (Favorite, Ingredient, Recipe,
+                          ShoppingCartIngredient, ShoppingList, Tag,
+                          TimelineEntry, User)
 
+from . import short_links
+from .caching import get_recipe_data_changed_at, get_recipe_etag_version
 from .filters import IngredientFilter, RecipeFilter
-from .mixins import RecipeActionMixin, SubscriptionMixin
-from .pagination import CustomLimitPagination
+from .ingredient_index import ingredient_index
+from .mixins import (AnonymousCacheMixin, ConditionalGetMixin,
+                     RecipeActionMixin, SubscriptionMixin)
+from .pagination import (CustomCursorPagination, CustomLimitPagination,
+                         PageLimitPagination)
+from .pantry_index import pantry_index
 from .permissions import IsAdminOrAuthorOrReadOnly
+from .renderers import ShoppingListCSVRenderer, ShoppingListTextRenderer
 from .serializers import (AvatarSerializer, FavoriteRecipeSerializer,
-                          IngredientInfoSerializer, RecipeCreateSerializer,
-                          RecipeInfoSerializer, ShoppingCartRecipeSerializer,
+                          IngredientInfoSerializer, PantryQuerySerializer,
+                          PantryRecipeSerializer, RecipeBriefInfoSerializer,
+                          RecipeCreateSerializer, RecipeInfoSerializer,
+                          ShoppingCartRecipeSerializer,
                           SubscriptionSerializer, TagInfoSerializer,
                           UserProfileSerializer)
 from .utils import generate_shopping_list
 
 
 @require_GET
-def short_url_generate(request, pk):
-    """Перенаправление по короткой ссылке рецепта."""
-    get_object_or_404(Recipe, pk=pk)
-    url = reverse("recipes_detail", args=[pk])
-    return redirect(url)
+def short_url_generate(request, code):
+    """Перенаправление по короткой ссылке на страницу рецепта."""
+    pk = short_links.resolve(code)
+    if pk is None:
+        raise Http404('Рецепт не найден.')
+    return redirect(f'/recipes/{pk}')
 
 
 class CustomUserViewSet(UserViewSet, SubscriptionMixin):
@@ -87,10 +100,7 @@ class CustomUserViewSet(UserViewSet, SubscriptionMixin):
     )
     def get_subscriptions(self, request):
         """Получение списка подписок с пагинацией."""
-        user = request.user
-        queryset = User.objects.filter(follower__user=user).annotate(
-            recipes_count=Count('recipes')
-        )
+        queryset = self.get_subscriptions_queryset(request.user)
 
         pages = self.paginate_queryset(queryset)
         serializer = SubscriptionSerializer(
@@ -102,14 +112,18 @@ class CustomUserViewSet(UserViewSet, SubscriptionMixin):
         return self.get_paginated_response(serializer.data)
 
 
-class TagListViewSet(viewsets.ReadOnlyModelViewSet):
+class TagListViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     pagination_class = None
     permission_classes = [IsAdminOrAuthorOrReadOnly]
     queryset = Tag.objects.all()
     serializer_class = TagInfoSerializer
 
+    def get_last_modified(self, request):
+        return get_recipe_data_changed_at()
+
 
-class IngredientListViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientListViewSet(ConditionalGetMixin,
+                            viewsets.ReadOnlyModelViewSet):
     """Вьюсет для просмотра ингредиентов."""
 
     filter_backends = (DjangoFilterBackend,)
@@ -119,22 +133,60 @@ class IngredientListViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientInfoSerializer
 
+    def get_data_version(self, request):
+        return ingredient_index.get_version()[0]
+
+    def get_last_modified(self, request):
+        return ingredient_index.get_version()[1]
+
+    def list(self, request, *args, **kwargs):
+        """Поиск по началу названия через индекс в памяти, без запросов.
+
+        При INGREDIENT_SEARCH_MODE, отличном от index, поиск идёт в базе.
+        """
+        if settings.INGREDIENT_SEARCH_MODE != 'index':
+            return super().list(request, *args, **kwargs)
+        return self.conditional_response(self.search_index, request)
 
-class RecipeManagementViewSet(viewsets.ModelViewSet, RecipeActionMixin):
+    def search_index(self, request):
+        return Response(ingredient_index.search(
+            request.query_params.get('name', '').strip()
+        ))
+
+
+class RecipeManagementViewSet(ConditionalGetMixin, AnonymousCacheMixin,
+                              viewsets.ModelViewSet, RecipeActionMixin):
     """Вьюсет для управления рецептами."""
 
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
     pagination_class = CustomLimitPagination
     permission_classes = [IsAdminOrAuthorOrReadOnly]
-    queryset = Recipe.objects.select_related(
-        'author').prefetch_related('ingredients', 'tags')
+    queryset = Recipe.objects.with_related()
+
+    def get_queryset(self):
+        """Аннотирует рецепты флагами избранного и списка покупок.
+
+        Изменению и удалению связи и флаги рецепта не нужны.
+        """
+        if self.action in ('update', 'partial_update', 'destroy'):
+            return Recipe.objects.defer('search_vector', 'ingredient_ids')
+        return super().get_queryset().with_user_flags(self.request.user)
 
     def get_permissions(self):
         """Разрешаем доступ без аутентификации list, retrieve и get-link."""
         if self.action in ('list', 'retrieve', 'get-link'):
             return [AllowAny()]
-        return [IsAdminOrAuthorOrReadOnly()]
+        return super().get_permissions()
+
+    def get_data_version(self, request):
+        return get_recipe_etag_version(request.user)
+
+    def get_last_modified(self, request):
+        """Флаги пользователя не отражаются во времени смены версии."""
+        if request.user.is_anonymous:
+            return get_recipe_data_changed_at()
+        return None
 
     def get_serializer_class(self):
         """Выбор сериализатора в зависимости от действия."""
@@ -146,29 +198,102 @@ class RecipeManagementViewSet(viewsets.ModelViewSet, RecipeActionMixin):
         detail=False,
         methods=['GET'],
         permission_classes=[IsAuthenticated],
+        renderer_classes=[
+            ShoppingListTextRenderer,
+            ShoppingListCSVRenderer,
+            JSONRenderer,
+        ],
         url_path='download_shopping_cart',
     )
     def download_shopping_cart(self, request):
-        """Генерация списка покупок с использованием утилиты."""
-        ingredients = RecipeToIngredient.objects.filter(
-            recipe__shopping_list__user=request.user
+        """Потоковая выгрузка списка покупок в формате txt, csv или json."""
+        renderer = request.accepted_renderer
+        ingredients = ShoppingCartIngredient.objects.filter(
+            user=request.user
         ).values(
             'ingredient__name',
             'ingredient__measurement_unit',
-        ).annotate(
-            sum=Sum('amount'),
-        )
+            sum=F('amount'),
+        ).order_by(
+            'ingredient__name',
+            'ingredient__measurement_unit',
+        ).iterator()
 
-        return HttpResponse(
-            generate_shopping_list(ingredients),
-            content_type='text/plain',
+        return StreamingHttpResponse(
+            generate_shopping_list(ingredients, renderer.format),
+            content_type=f'{renderer.media_type}; charset=utf-8',
             headers={
                 'Content-Disposition': (
-                    'attachment; filename="shopping_list.txt"'
+                    'attachment; '
+                    f'filename="shopping_list.{renderer.format}"'
                 ),
             },
         )
 
+    @action(
+        detail=False,
+        methods=['GET'],
+        permission_classes=[IsAuthenticated],
+        pagination_class=CustomCursorPagination,
+        url_path='feed',
+    )
+    def feed(self, request):
+        """Лента рецептов авторов, на которых подписан пользователь."""
+        page = self.paginate_queryset(
+            TimelineEntry.objects.feed(request.user).with_related()
+            .with_user_flags(request.user)
+        )
+        serializer = RecipeInfoSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        permission_classes=[AllowAny],
+        pagination_class=PageLimitPagination,
+        url_path='pantry',
+    )
+    def pantry(self, request):
+        """Рецепты из имеющихся ингредиентов, самые полные первыми."""
+        params = PantryQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        pantry = set(params.validated_data['ingredients'])
+        page = self.paginate_queryset(pantry_index.match(
+            pantry,
+            params.validated_data['max_missing'],
+            limit=settings.PANTRY_MAX_RESULTS,
+        ))
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page]
+        )
+        # Рецепты, удалённые после снимка индекса, пропускаются.
+        serializer = PantryRecipeSerializer(
+            [recipes[recipe_id] for recipe_id, _, _ in page
+             if recipe_id in recipes],
+            many=True,
+            context={**self.get_serializer_context(), 'pantry': pantry},
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=True,
+        methods=['GET'],
+        permission_classes=[AllowAny],
+        url_path='similar',
+    )
+    def similar(self, request, pk=None):
+        """Похожие рецепты из предрасчитанного списка соседей."""
+        if not pk.isdigit() or not short_links.recipe_exists(int(pk)):
+            raise Http404('Рецепт не найден.')
+        recipes = Recipe.objects.filter(similar_to__recipe=pk).only(
+            *RecipeBriefInfoSerializer.Meta.fields
+        ).order_by('-similar_to__score', '-id')
+        return Response(RecipeBriefInfoSerializer(
+            recipes, many=True, context=self.get_serializer_context()
+        ).data)
+
     @action(
         detail=True,
         methods=['GET'],
@@ -176,11 +301,12 @@ class RecipeManagementViewSet(viewsets.ModelViewSet, RecipeActionMixin):
         url_path='get-link',
     )
     def get_link(self, request, pk=None):
-        """Получение короткой ссылки на рецепт."""
-        recipe = get_object_or_404(Recipe, pk=pk)
+        """Получение короткой ссылки на рецепт без загрузки рецепта."""
+        if not pk.isdigit() or not short_links.recipe_exists(int(pk)):
+            raise Http404('Рецепт не найден.')
         return Response({
             'short-link': request.build_absolute_uri(
-                reverse('short_url', args=[recipe.pk])
+                reverse('short_url', args=[short_links.encode(int(pk))])
             )
         },
             status=status.HTTP_200_OK
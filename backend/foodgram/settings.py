@@ -20,6 +20,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework.authtoken',
     'rest_framework',
     'admin_auto_filters',
@@ -31,6 +32,8 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    'api.middleware.QueryBudgetMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -76,6 +79,34 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения: DB_REPLICAS=host[:port][/name],...
+REPLICA_DATABASES = []
+for number, replica in enumerate(
+    filter(None, os.getenv('DB_REPLICAS', '').split(',')), start=1
+):
+    address, _, name = replica.strip().partition('/')
+    host, _, port = address.partition(':')
+    REPLICA_DATABASES.append(f'replica_{number}')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'NAME': name or DATABASES['default']['NAME'],
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['api.db_routers.PrimaryReplicaRouter']
+# Сколько секунд после записи клиент читает с основной базы.
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 10))
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
@@ -134,6 +165,114 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# index — префиксный индекс в памяти, prefix — name__istartswith в базе,
+# contains — name__icontains в базе, совпадения с начала названия первыми.
+INGREDIENT_SEARCH_MODE = os.getenv('INGREDIENT_SEARCH_MODE', 'index')
+# Конфигурация полнотекстового поиска рецептов (стемминг и стоп-слова).
+SEARCH_CONFIG = os.getenv('SEARCH_CONFIG', 'russian')
+
+# Подбор рецептов по имеющимся ингредиентам (api/pantry_index.py).
+PANTRY_MAX_INGREDIENTS = 100
+PANTRY_MAX_MISSING = 3
+PANTRY_MAX_RESULTS = 1000
+# Снимок рецептов в памяти перестраивается, если он старше стольких
+# секунд или после него изменилось больше стольких рецептов.
+PANTRY_INDEX_MAX_AGE = int(os.getenv('PANTRY_INDEX_MAX_AGE', 600))
+PANTRY_INDEX_MAX_DELTA = int(os.getenv('PANTRY_INDEX_MAX_DELTA', 2000))
+
+# Похожие рецепты (команда compute_similar_recipes): сколько соседей
+# хранить, вес сходства тегов против сходства ингредиентов и доля
+# рецептов, начиная с которой ингредиент (соль, вода) не учитывается.
+SIMILAR_RECIPES_TOP_K = 10
+SIMILAR_RECIPES_TAG_WEIGHT = 0.25
+SIMILAR_RECIPES_MAX_DF = 0.1
+
+# Лента подписок: рецепты авторов с большим числом подписчиков не
+# рассылаются по лентам, а читаются через подписки; после подписки в
+# ленту добавляется FEED_BACKFILL_SIZE последних рецептов автора.
+FEED_FANOUT_MAX_FOLLOWERS = 10_000
+FEED_FANOUT_BATCH_SIZE = 1000
+FEED_BACKFILL_SIZE = 100
+
+MAX_IMAGE_UPLOAD_SIZE = 10 * 1024 * 1024
+MAX_IMAGE_PIXELS = 40_000_000
+IMAGE_MAX_SIDE = 2048
+IMAGE_FORMAT = 'WEBP'
+IMAGE_QUALITY = 85
+# Варианты картинок: имя -> (ширина, высота, обрезать до точного размера).
+IMAGE_VARIANTS = {
+    'recipe': {
+        'card': (480, 360, True),
+        'detail': (1200, 900, False),
+    },
+    'avatar': {
+        'avatar': (160, 160, True),
+    },
+}
+IMAGE_VARIANTS_ASYNC = os.getenv('IMAGE_VARIANTS_ASYNC', 'true').lower() == 'true'
+IMAGE_VARIANT_WORKERS = int(os.getenv('IMAGE_VARIANT_WORKERS', 2))
+
+RECIPE_CACHE_TIMEOUT = 600
+
+# Асинхронные представления чтения (api/async_views.py); имеет смысл
+# только под ASGI-сервером.
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'false').lower() == 'true'
+
+# Заголовки X-DB-* со статистикой SQL-запросов и проверка QUERY_BUDGETS.
+QUERY_INSTRUMENTATION = os.getenv(
+    'QUERY_INSTRUMENTATION', str(DEBUG)
+).lower() == 'true'
+# Превышение бюджета — исключение вместо предупреждения в логе.
+QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', 'false').lower() == 'true'
+# Наибольшее число SQL-запросов для (метод, имя маршрута) api/urls.py,
+# включая проверку токена.
+QUERY_BUDGETS = {
+    ('GET', 'ingredients-detail'): 2,
+    # В режиме index список ингредиентов обходится без запросов к базе.
+    ('GET', 'ingredients-list'): 1 if INGREDIENT_SEARCH_MODE == 'index' else 2,
+    ('GET', 'recipes-detail'): 5,
+    ('GET', 'recipes-download-shopping-cart'): 2,
+    ('GET', 'recipes-feed'): 6,
+    ('GET', 'recipes-get-link'): 2,
+    ('GET', 'recipes-pantry'): 6,
+    ('GET', 'recipes-similar'): 3,
+    ('GET', 'recipes-list'): 8,
+    ('GET', 'tags-detail'): 2,
+    ('GET', 'tags-list'): 2,
+    ('GET', 'users-detail'): 3,
+    ('GET', 'users-get-subscriptions'): 4,
+    ('GET', 'users-list'): 4,
+    ('GET', 'users-me'): 2,
+    ('POST', 'recipes-add-to-favorite'): 8,
+    ('DELETE', 'recipes-add-to-favorite'): 6,
+    ('POST', 'recipes-add-to-shopping-cart'): 9,
+    ('DELETE', 'recipes-add-to-shopping-cart'): 10,
+    ('POST', 'recipes-list'): 18,
+    # Рецепт в избранном и в списке покупок: смена ингредиентов правит
+    # агрегат списка покупок, удаление каскадно чистит связанные строки.
+    ('PATCH', 'recipes-detail'): 20,
+    ('PUT', 'recipes-detail'): 20,
+    ('DELETE', 'recipes-detail'): 18,
+    ('POST', 'users-list'): 2,
+    ('POST', 'users-set-password'): 2,
+    ('POST', 'users-subscribe'): 8,
+    ('DELETE', 'users-subscribe'): 5,
+    ('PUT', 'users-avatar-put-delete'): 2,
+    ('DELETE', 'users-avatar-put-delete'): 2,
+    ('POST', 'login'): 4,
+    ('POST', 'logout'): 2,
+}
+
+# Начиная с такой оценки планировщика списки админки не считают
+# строки точно.
+ADMIN_EXACT_COUNT_LIMIT = 10_000
+
+# Ключ перестановки коротких ссылок: при смене старые ссылки перестанут
+# открываться.
+SHORT_LINK_KEY = int(os.getenv('SHORT_LINK_KEY', '0x5A17C0DE42'), 0)
+SHORT_LINK_CACHE_TIMEOUT = 24 * 60 * 60
+SHORT_LINK_NEGATIVE_CACHE_TIMEOUT = 60
+
 DEFAULT_PAGE_SIZE = 6
 MAX_COOKING_TIME = 720
 MIN_COOKING_TIME = 1
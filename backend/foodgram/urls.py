@@ -1,10 +1,15 @@
 from api.urls import urls as api_urls
 from api.views import short_url_generate
+from django.conf import settings
 from django.contrib import admin
 from django.urls import include, path
 
+short_url_view = short_url_generate
+if settings.ASYNC_READ_VIEWS:
+    from api.async_views import short_url_redirect as short_url_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include(api_urls)),
-    path('short/<int:pk>/', short_url_generate, name='short_url')
+    path('short/<str:code>/', short_url_view, name='short_url')
 ]
@@ -0,0 +1,179 @@
+import base64
+import contextvars
+import io
+from io import StringIO
+
+import pytest
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api import images
+from api.pantry_index import pantry_index
+from users.models import (Favorite, Follow, Ingredient, Recipe,
+                          RecipeToIngredient, ShoppingList, Tag, User)
+
+AUTHORS = 3
+RECIPES_PER_AUTHOR = 4
+INGREDIENTS = 8
+REPLICA = 'replica'
+
+
+class RequestlessExecutor:
+    """
+    Выполняет фоновые задачи сразу, но вне контекста HTTP-запроса
+    Как и в потоке пула, запросы задачи не попадают в статистику
+    QueryBudgetMiddleware.
+    """
+
+    def submit(self, function, *args):
+        contextvars.Context().run(function, *args)
+
+
+@pytest.fixture(scope='session')
+def django_db_modify_db_settings(
+    django_db_modify_db_settings_parallel_suffix,
+):
+    """
+    Реплика — зеркало основной тестовой базы, как DB_REPLICAS в бою
+    Запросы идут к ней, только если тест включил её в REPLICA_DATABASES.
+    """
+    default = settings.DATABASES['default']
+    settings.DATABASES[REPLICA] = {
+        **default,
+        'TEST': {**default.get('TEST', {}), 'MIRROR': 'default'},
+    }
+
+
+@pytest.fixture(autouse=True)
+def query_budgets(settings, tmp_path, monkeypatch):
+    """
+    Строгая проверка QUERY_BUDGETS на каждом запросе к API
+    Кеш и снимок индекса подбора по ингредиентам сбрасываются, чтобы
+    запросы шли к базе, как на холодном сервере.
+    """
+    settings.QUERY_INSTRUMENTATION = True
+    settings.QUERY_BUDGET_STRICT = True
+    settings.MEDIA_ROOT = tmp_path
+    monkeypatch.setattr(images, 'executor', RequestlessExecutor())
+    monkeypatch.setattr(pantry_index, '_state', None)
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def replica(settings):
+    """Включает чтение с реплики для запросов к API."""
+    settings.REPLICA_DATABASES = [REPLICA]
+    return REPLICA
+
+
+def create_user(username):
+    return User.objects.create_user(
+        username=username,
+        email=f'{username}@example.com',
+        password='Pa55word!',
+        first_name=username.capitalize(),
+        last_name='Тестов',
+    )
+
+
+def create_recipe(author, number, tags, ingredients):
+    """Рецепт с ингредиентами в одной транзакции, как в сериализаторе."""
+    with transaction.atomic():
+        recipe = Recipe.objects.create(
+            author=author,
+            name=f'Суп номер {number}',
+            text='Сварить и подать горячим.',
+            cooking_time=10 + number,
+            image=f'recipes/test_{number}.png',
+            image_variants={'source': f'recipes/test_{number}.png'},
+        )
+        recipe.tags.set(tags)
+        RecipeToIngredient.objects.bulk_create(
+            RecipeToIngredient(recipe=recipe, ingredient=ingredient,
+                               amount=number + 1)
+            for ingredient in ingredients
+        )
+    return recipe
+
+
+@pytest.fixture
+def data(transactional_db):
+    """
+    Набор данных, на котором видны запросы в цикле
+    Пользователь подписан на нескольких авторов, у каждого несколько
+    рецептов; часть рецептов в избранном и в списке покупок. Транзакции
+    фиксируются, поэтому работают обработчики on_commit.
+    """
+    tags = [
+        Tag.objects.create(name=f'Тег {number}', slug=f'tag_{number}')
+        for number in range(3)
+    ]
+    ingredients = [
+        Ingredient.objects.create(
+            name=f'Ингредиент {number}', measurement_unit='г'
+        )
+        for number in range(INGREDIENTS)
+    ]
+    user = create_user('reader')
+    authors = [create_user(f'author{number}') for number in range(AUTHORS)]
+    for author in authors:
+        Follow.objects.create(user=user, author=author)
+    recipes = [
+        create_recipe(
+            author, number, tags[number % 2:number % 2 + 2],
+            ingredients[number % 5:number % 5 + 3],
+        )
+        for number, author in enumerate(
+            author for author in authors for _ in range(RECIPES_PER_AUTHOR)
+        )
+    ]
+    for recipe in recipes[::3]:
+        Favorite.objects.create(user=user, recipe=recipe)
+        ShoppingList.objects.create(user=user, recipe=recipe)
+    call_command('compute_similar_recipes', stdout=StringIO())
+    return {
+        'authors': authors,
+        'ingredients': ingredients,
+        'recipes': recipes,
+        'tags': tags,
+        'user': user,
+    }
+
+
+@pytest.fixture
+def image():
+    """Картинка в формате, который принимает CustomImageField."""
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), (230, 160, 90)).save(buffer, 'PNG')
+    return (
+        'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode()
+    )
+
+
+@pytest.fixture
+def anonymous_client():
+    return APIClient()
+
+
+@pytest.fixture
+def user_client(data):
+    """Клиент с токеном: бюджеты учитывают и проверку токена."""
+    client = APIClient()
+    token = Token.objects.create(user=data['user'])
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
+
+
+@pytest.fixture
+def author_client(data):
+    client = APIClient()
+    token = Token.objects.create(user=data['authors'][0])
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
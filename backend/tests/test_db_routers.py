@@ -0,0 +1,58 @@
+"""
+Чтение с реплики и read-your-writes
+Реплика в тестах — зеркало основной базы, поэтому данные на ней те же;
+проверяется, к какому подключению уходят запросы.
+"""
+import pytest
+from django.db import connections, router
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+from users.models import Recipe
+
+pytestmark = [
+    pytest.mark.django_db(transaction=True, databases='__all__'),
+    pytest.mark.usefixtures('replica'),
+]
+
+
+def get_queries(client, method, url):
+    """Ответ и число запросов к основной базе и к реплике."""
+    with CaptureQueriesContext(connections['default']) as default, \
+            CaptureQueriesContext(connections['replica']) as replica:
+        response = getattr(client, method)(url)
+    return response, len(default), len(replica)
+
+
+def test_anonymous_get_reads_from_replica(anonymous_client, data):
+    response, default, replica = get_queries(
+        anonymous_client, 'get', '/api/recipes/'
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert replica and not default
+
+
+def test_reads_after_write_stay_on_default(user_client, data):
+    recipe = data['recipes'][1]
+    response, _, replica = get_queries(user_client, 'get', '/api/recipes/')
+    assert response.status_code == status.HTTP_200_OK
+    assert replica
+
+    response, _, replica = get_queries(
+        user_client, 'post', f'/api/recipes/{recipe.pk}/favorite/'
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    assert not replica
+
+    response, default, replica = get_queries(
+        user_client, 'get', '/api/recipes/?is_favorited=1'
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert default and not replica
+    assert recipe.pk in {item['id'] for item in response.data['results']}
+
+
+def test_writes_and_migrations_use_default(replica):
+    assert router.db_for_write(Recipe) == 'default'
+    assert not router.allow_migrate(replica, 'users', model_name='recipe')
+    assert router.allow_migrate('default', 'users', model_name='recipe')
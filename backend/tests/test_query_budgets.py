@@ -0,0 +1,328 @@
+"""
+Бюджеты SQL-запросов маршрутов API
+Каждый тест выполняет запросы к одному маршруту. QueryBudgetMiddleware в
+строгом режиме проверяет число запросов по QUERY_BUDGETS и падает при
+превышении. Списки дополнительно запрашиваются с разным размером страницы:
+число запросов не должно от него зависеть, иначе в сериализации есть
+запросы в цикле.
+"""
+import pytest
+from django.conf import settings
+from django.urls import URLPattern, URLResolver
+from rest_framework import status
+
+from api.pantry_index import pantry_index
+from api.urls import urls
+from users.models import Favorite, Follow, ShoppingList
+
+# Маршруты djoser, которыми фронтенд не пользуется: письма активации и
+# смены пароля или почты, изменение и удаление профиля. Копия этих же
+# маршрутов в auth/ из djoser.urls не проверяется вовсе.
+UNBUDGETED_ROUTES = {
+    ('DELETE', 'users-detail'),
+    ('PATCH', 'users-detail'),
+    ('POST', 'users-activation'),
+    ('POST', 'users-resend-activation'),
+    ('POST', 'users-reset-password'),
+    ('POST', 'users-reset-password-confirm'),
+    ('POST', 'users-reset-username'),
+    ('POST', 'users-reset-username-confirm'),
+    ('POST', 'users-set-username'),
+    ('PUT', 'users-detail'),
+}
+PAGE_SIZES = (1, 3, 6)
+
+
+def query_count(response):
+    """Число SQL-запросов по заголовку QueryBudgetMiddleware."""
+    assert 'X-DB-Query-Budget' in response, 'У маршрута нет бюджета.'
+    return int(response['X-DB-Query-Count'])
+
+
+def assert_same_query_count(client, urls):
+    """Запросы по всем адресам укладываются в бюджет и стоят одинаково."""
+    counts = {}
+    for url in urls:
+        response = client.get(url)
+        assert response.status_code == status.HTTP_200_OK, url
+        counts[url] = query_count(response)
+    assert len(set(counts.values())) == 1, counts
+
+
+def api_routes():
+    """Пары (метод, имя маршрута) из api/urls.py."""
+    routes = set()
+
+    def collect(patterns):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                module = getattr(pattern.urlconf_name, '__name__', None)
+                if module != 'djoser.urls':
+                    collect(pattern.url_patterns)
+                continue
+            if not isinstance(pattern, URLPattern) or not pattern.name:
+                continue
+            callback = pattern.callback
+            actions = getattr(callback, 'actions', None)
+            if actions:
+                # DRF дописывает в actions метод head после первого запроса.
+                methods = [method for method in actions if method != 'head']
+            elif hasattr(callback, 'cls'):
+                methods = [
+                    method for method in callback.cls.http_method_names
+                    if hasattr(callback.cls, method)
+                    and method not in ('head', 'options')
+                ]
+            else:
+                continue
+            routes.update(
+                (method.upper(), pattern.name) for method in methods
+            )
+
+    collect(urls)
+    return routes
+
+
+def test_every_route_has_budget():
+    routes = api_routes() - {('GET', 'api-root'), ('GET', 'redoc')}
+    assert routes - UNBUDGETED_ROUTES <= settings.QUERY_BUDGETS.keys(), (
+        sorted(routes - UNBUDGETED_ROUTES - settings.QUERY_BUDGETS.keys())
+    )
+    assert settings.QUERY_BUDGETS.keys() <= routes
+
+
+@pytest.mark.parametrize('client_name', ('anonymous_client', 'user_client'))
+def test_recipe_list(request, data, client_name):
+    client = request.getfixturevalue(client_name)
+    assert_same_query_count(client, [
+        f'/api/recipes/?limit={size}' for size in PAGE_SIZES
+    ])
+
+
+@pytest.mark.parametrize('params', (
+    'is_favorited=1',
+    'is_in_shopping_cart=1',
+    'tags=tag_0&tags=tag_1',
+    'search=суп',
+    'pagination=cursor',
+))
+def test_recipe_list_filters(user_client, params):
+    assert_same_query_count(user_client, [
+        f'/api/recipes/?{params}&limit={size}' for size in PAGE_SIZES
+    ])
+
+
+def test_recipe_list_ingredient_filters(user_client, data):
+    ingredient = data['ingredients'][2]
+    assert_same_query_count(user_client, [
+        f'/api/recipes/?ingredients={ingredient.pk}&limit={size}'
+        for size in PAGE_SIZES
+    ] + [
+        f'/api/recipes/?exclude_ingredients={ingredient.pk}&limit={size}'
+        for size in PAGE_SIZES
+    ])
+
+
+@pytest.mark.parametrize('client_name', ('anonymous_client', 'user_client'))
+def test_recipe_detail(request, data, client_name):
+    client = request.getfixturevalue(client_name)
+    assert_same_query_count(client, [
+        f'/api/recipes/{recipe.pk}/' for recipe in data['recipes'][:3]
+    ])
+
+
+def test_recipe_create(author_client, data, image):
+    response = author_client.post('/api/recipes/', {
+        'name': 'Новый суп',
+        'text': 'Сварить.',
+        'cooking_time': 15,
+        'image': image,
+        'tags': [tag.pk for tag in data['tags']],
+        'ingredients': [
+            {'id': ingredient.pk, 'amount': 5}
+            for ingredient in data['ingredients'][:4]
+        ],
+    }, format='json')
+    assert response.status_code == status.HTTP_201_CREATED, response.data
+    query_count(response)
+
+
+@pytest.mark.parametrize('method', ('put', 'patch'))
+def test_recipe_update(author_client, data, image, method):
+    recipe = data['recipes'][0]
+    response = getattr(author_client, method)(
+        f'/api/recipes/{recipe.pk}/', {
+            'name': 'Другой суп',
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'image': image,
+            'tags': [data['tags'][2].pk],
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': 7}
+                for ingredient in data['ingredients'][3:6]
+            ],
+        }, format='json',
+    )
+    assert response.status_code == status.HTTP_200_OK, response.data
+    query_count(response)
+
+
+def test_recipe_delete(author_client, data):
+    recipe = data['recipes'][0]
+    response = author_client.delete(f'/api/recipes/{recipe.pk}/')
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    query_count(response)
+
+
+@pytest.mark.parametrize('path, model', (
+    ('favorite', Favorite),
+    ('shopping_cart', ShoppingList),
+))
+def test_recipe_user_lists(user_client, data, path, model):
+    recipe = data['recipes'][1]
+    response = user_client.post(f'/api/recipes/{recipe.pk}/{path}/')
+    assert response.status_code == status.HTTP_201_CREATED
+    query_count(response)
+    response = user_client.delete(f'/api/recipes/{recipe.pk}/{path}/')
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    query_count(response)
+    assert not model.objects.filter(
+        user=data['user'], recipe=recipe
+    ).exists()
+
+
+@pytest.mark.parametrize('export_format', ('txt', 'csv', 'json'))
+def test_download_shopping_cart(user_client, django_assert_max_num_queries,
+                                export_format):
+    # Выгрузка потоковая: запросы при отдаче ответа middleware не видит,
+    # поэтому ответ читается целиком под django_assert_max_num_queries.
+    budget = settings.QUERY_BUDGETS[('GET', 'recipes-download-shopping-cart')]
+    with django_assert_max_num_queries(budget):
+        response = user_client.get(
+            f'/api/recipes/download_shopping_cart/?format={export_format}'
+        )
+        content = b''.join(response.streaming_content)
+    assert response.status_code == status.HTTP_200_OK
+    assert 'Ингредиент' in content.decode()
+
+
+def test_recipe_get_link(user_client, data):
+    response = user_client.get(
+        f'/api/recipes/{data["recipes"][0].pk}/get-link/'
+    )
+    assert response.status_code == status.HTTP_200_OK
+    query_count(response)
+
+
+def test_similar_recipes(user_client, data):
+    assert_same_query_count(user_client, [
+        f'/api/recipes/{recipe.pk}/similar/' for recipe in data['recipes']
+    ])
+
+
+def test_pantry(user_client, data):
+    ingredients = '&'.join(
+        f'ingredients={ingredient.pk}'
+        for ingredient in data['ingredients'][:5]
+    )
+    # Снимок индекса строится один раз на процесс, а не на запрос.
+    pantry_index.match(set())
+    assert_same_query_count(user_client, [
+        f'/api/recipes/pantry/?{ingredients}&max_missing=3&limit={size}'
+        for size in PAGE_SIZES
+    ])
+
+
+def test_feed(user_client):
+    assert_same_query_count(user_client, [
+        f'/api/recipes/feed/?limit={size}' for size in PAGE_SIZES
+    ])
+
+
+def test_tags(user_client, data):
+    assert_same_query_count(user_client, ['/api/tags/'])
+    assert_same_query_count(user_client, [
+        f'/api/tags/{tag.pk}/' for tag in data['tags']
+    ])
+
+
+def test_ingredients(anonymous_client, user_client, data):
+    # Первый запрос строит индекс ингредиентов в памяти процесса.
+    anonymous_client.get('/api/ingredients/')
+    assert_same_query_count(user_client, [
+        '/api/ingredients/', '/api/ingredients/?name=ингр',
+    ])
+    assert_same_query_count(user_client, [
+        f'/api/ingredients/{ingredient.pk}/'
+        for ingredient in data['ingredients'][:3]
+    ])
+
+
+def test_users(user_client, data):
+    assert_same_query_count(user_client, [
+        f'/api/users/?limit={size}' for size in PAGE_SIZES
+    ])
+    assert_same_query_count(user_client, [
+        f'/api/users/{author.pk}/' for author in data['authors']
+    ])
+    assert_same_query_count(user_client, ['/api/users/me/'])
+
+
+def test_subscriptions(user_client):
+    assert_same_query_count(user_client, [
+        f'/api/users/subscriptions/?limit={size}&recipes_limit={size}'
+        for size in PAGE_SIZES
+    ])
+
+
+def test_subscribe(user_client, data):
+    author = data['authors'][0]
+    response = user_client.delete(f'/api/users/{author.pk}/subscribe/')
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    query_count(response)
+    response = user_client.post(f'/api/users/{author.pk}/subscribe/')
+    assert response.status_code == status.HTTP_201_CREATED
+    query_count(response)
+    assert Follow.objects.filter(user=data['user'], author=author).exists()
+
+
+def test_avatar(user_client, image):
+    response = user_client.put(
+        '/api/users/me/avatar/', {'avatar': image}, format='json'
+    )
+    assert response.status_code == status.HTTP_200_OK, response.data
+    query_count(response)
+    response = user_client.delete('/api/users/me/avatar/')
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    query_count(response)
+
+
+def test_registration_and_password(anonymous_client, data):
+    response = anonymous_client.post('/api/users/', {
+        'email': 'new@example.com',
+        'username': 'newcomer',
+        'first_name': 'Новый',
+        'last_name': 'Пользователь',
+        'password': 'Pa55word!',
+    }, format='json')
+    assert response.status_code == status.HTTP_201_CREATED, response.data
+    query_count(response)
+
+    response = anonymous_client.post('/api/auth/token/login/', {
+        'email': 'new@example.com', 'password': 'Pa55word!',
+    }, format='json')
+    assert response.status_code == status.HTTP_200_OK, response.data
+    query_count(response)
+    anonymous_client.credentials(
+        HTTP_AUTHORIZATION=f'Token {response.data["auth_token"]}'
+    )
+
+    response = anonymous_client.post('/api/users/set_password/', {
+        'current_password': 'Pa55word!', 'new_password': 'N3wPa55word!',
+    }, format='json')
+    assert response.status_code == status.HTTP_204_NO_CONTENT, response.data
+    query_count(response)
+
+    response = anonymous_client.post('/api/auth/token/logout/')
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    query_count(response)
@@ -1,5 +1,11 @@
+import json
+
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 
 from admin_auto_filters.filters import AutocompleteFilter
 
@@ -10,6 +16,33 @@ EMPTY_FIELD_VALUE = 'Не задано'
 INLINE_FORM_EXTRA = 1
 
 
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор, который для больших таблиц берёт оценку числа строк
+    из плана запроса вместо точного COUNT(*)
+    Точный подсчёт выполняется, только если оценка планировщика меньше
+    ADMIN_EXACT_COUNT_LIMIT
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if connections[queryset.db].vendor == 'postgresql':
+            plan = json.loads(queryset.explain(format='json'))
+            estimate = plan[0]['Plan']['Plan Rows']
+            if estimate >= settings.ADMIN_EXACT_COUNT_LIMIT:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Список объектов без точных COUNT(*) по большим таблицам."""
+
+    empty_value_display = EMPTY_FIELD_VALUE
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
 class AuthorFilter(AutocompleteFilter):
     title = 'Автор рецепта'
     field_name = 'author'
@@ -60,6 +93,7 @@ class CustomUserAdmin(BaseUserAdmin):
         'is_active',
         'date_joined',
         'last_login',
+        'recipes_count',
     )
     list_filter = ('is_staff', 'is_superuser', 'is_active', 'groups')
     search_fields = ('username', 'first_name', 'last_name', 'email')
@@ -87,8 +121,7 @@ class CustomUserAdmin(BaseUserAdmin):
 
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
-    empty_value_display = EMPTY_FIELD_VALUE
+class FavoriteAdmin(LargeTableAdmin):
     list_display = ('user', 'recipe')
     list_filter = (UserFilter, RecipeFilter)
     autocomplete_fields = ('user', 'recipe')
@@ -107,30 +140,20 @@ class IngredientAdmin(admin.ModelAdmin):
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
-    empty_value_display = EMPTY_FIELD_VALUE
+class RecipeAdmin(LargeTableAdmin):
     filter_horizontal = ('tags',)
     inlines = (RecipeToIngredientInLine,)
-    list_display = ('name', 'author', 'get_favorite_count')
+    list_display = ('name', 'author', 'favorites_count')
     list_filter = (AuthorFilter, IngredientFilter, TagFilter)
     search_fields = ('name',)
     autocomplete_fields = ('author',)
 
-    @admin.display(description='В избранном')
-    def get_favorite_count(self, obj):
-        return obj.favorite.count()
-
     def get_queryset(self, request):
-        return (
-            super().get_queryset(request)
-            .select_related('author')
-            .prefetch_related('ingredients', 'tags', 'favorite')
-        )
+        return super().get_queryset(request).select_related('author')
 
 
 @admin.register(ShoppingList)
-class ShoppingListAdmin(admin.ModelAdmin):
-    empty_value_display = EMPTY_FIELD_VALUE
+class ShoppingListAdmin(LargeTableAdmin):
     list_display = ('user', 'recipe')
     list_filter = (UserFilter, RecipeFilter)
     autocomplete_fields = ('user', 'recipe')
@@ -0,0 +1,235 @@
+import json
+import random
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from users.models import Ingredient, Recipe, Tag, User
+
+# Имя замера -> (вес в смеси, нужна ли авторизация).
+REQUEST_MIX = {
+    'recipes-list': (30, False),
+    'recipes-list-tags': (10, False),
+    'recipes-list-auth': (10, True),
+    'recipes-list-cursor': (5, False),
+    'recipes-detail': (15, False),
+    'recipes-detail-auth': (10, True),
+    'ingredients-search': (10, False),
+    'tags-list': (3, False),
+    'subscriptions': (4, True),
+    'shopping-cart-download': (3, True),
+}
+SAMPLE_SIZE = 1000
+AUTH_USERS = 50
+
+
+def percentile(values, share):
+    """Значение по ближайшему рангу в отсортированном списке."""
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, round(share * len(values)) - 1))
+    return values[index]
+
+
+class Command(BaseCommand):
+    """
+    Нагрузочный замер API смесью типичных запросов на чтение.
+    """
+    help = (
+        'Воспроизводит смесь запросов к API в процессе или по HTTP и '
+        'выводит задержки, пропускную способность и число SQL-запросов '
+        'в JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000,
+                            help='Количество замеряемых запросов.')
+        parser.add_argument('--warmup', type=int, default=50,
+                            help='Запросы до начала замера.')
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Количество параллельных клиентов.')
+        parser.add_argument('--url',
+                            help='Адрес запущенного сервера, например '
+                                 'http://127.0.0.1:8000. По умолчанию '
+                                 'запросы выполняются в процессе.')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Зерно генератора смеси запросов.')
+        parser.add_argument('--output',
+                            help='Файл для JSON-отчёта вместо stdout.')
+
+    def handle(self, *args, **options):
+        """
+        Готовит список запросов, выполняет его и печатает отчёт.
+        """
+        rng = random.Random(options['seed'])
+        targets = self.load_targets()
+        plan = [
+            self.make_request(rng, targets)
+            for _ in range(options['warmup'] + options['requests'])
+        ]
+        warmup, plan = plan[:options['warmup']], plan[options['warmup']:]
+        send = (
+            self.http_sender(options['url']) if options['url']
+            else self.local_sender()
+        )
+
+        for request in warmup:
+            send(*request[1:])
+        started = time.monotonic()
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            results = list(executor.map(lambda request: (
+                request[0], *send(*request[1:])
+            ), plan))
+        elapsed = time.monotonic() - started
+
+        report = self.build_report(results, elapsed)
+        report['meta'] = {
+            'concurrency': options['concurrency'],
+            'mode': 'http' if options['url'] else 'in-process',
+            'requests': options['requests'],
+            'seed': options['seed'],
+            'warmup': options['warmup'],
+        }
+        output = json.dumps(report, indent=2, sort_keys=True,
+                            ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def load_targets(self):
+        """Выборки рецептов, тегов, ингредиентов и токенов для запросов."""
+        recipe_ids = list(
+            Recipe.objects.values_list('id', flat=True)[:SAMPLE_SIZE]
+        )
+        if not recipe_ids:
+            raise CommandError(
+                'Нет рецептов. Сначала выполните seed_data.'
+            )
+        users = User.objects.filter(recipes_count__gt=0).order_by('id')
+        tokens = [
+            Token.objects.get_or_create(user=user)[0].key
+            for user in users[:AUTH_USERS]
+        ]
+        return {
+            'ingredient_prefixes': sorted({
+                name[:2] for name in Ingredient.objects.values_list(
+                    'name', flat=True
+                )[:SAMPLE_SIZE]
+            }),
+            'recipe_ids': recipe_ids,
+            'tag_slugs': list(Tag.objects.values_list('slug', flat=True)),
+            'tokens': tokens,
+        }
+
+    def make_request(self, rng, targets):
+        """Случайный запрос смеси: (имя, путь, токен)."""
+        name = rng.choices(
+            list(REQUEST_MIX), [weight for weight, _ in REQUEST_MIX.values()]
+        )[0]
+        token = rng.choice(targets['tokens']) if REQUEST_MIX[name][1] else None
+        page = rng.randint(1, 5)
+        recipe_id = rng.choice(targets['recipe_ids'])
+        paths = {
+            'recipes-list': f'/api/recipes/?page={page}',
+            'recipes-list-tags': '/api/recipes/?tags={}'.format(
+                urllib.parse.quote(rng.choice(targets['tag_slugs'] or ['']))
+            ),
+            'recipes-list-auth': f'/api/recipes/?page={page}',
+            'recipes-list-cursor': '/api/recipes/?pagination=cursor',
+            'recipes-detail': f'/api/recipes/{recipe_id}/',
+            'recipes-detail-auth': f'/api/recipes/{recipe_id}/',
+            'ingredients-search': '/api/ingredients/?name={}'.format(
+                urllib.parse.quote(
+                    rng.choice(targets['ingredient_prefixes'] or [''])
+                )
+            ),
+            'tags-list': '/api/tags/',
+            'subscriptions': '/api/users/subscriptions/',
+            'shopping-cart-download': '/api/recipes/download_shopping_cart/',
+        }
+        return name, paths[name], token
+
+    def local_sender(self):
+        """Запросы через тестовый клиент Django с подсчётом SQL."""
+        def send(path, token):
+            client = Client(HTTP_HOST='localhost')
+            headers = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+            queries = 0
+
+            def count(execute, sql, params, many, context):
+                nonlocal queries
+                queries += 1
+                return execute(sql, params, many, context)
+
+            started = time.monotonic()
+            with connection.execute_wrapper(count):
+                response = client.get(path, **headers)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            return response.status_code, time.monotonic() - started, queries
+        return send
+
+    def http_sender(self, base_url):
+        """Запросы по HTTP; SQL считается по заголовку X-DB-Query-Count."""
+        def send(path, token):
+            request = urllib.request.Request(base_url.rstrip('/') + path)
+            if token:
+                request.add_header('Authorization', f'Token {token}')
+            started = time.monotonic()
+            try:
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+                    status, headers = response.status, response.headers
+            except urllib.error.HTTPError as error:
+                status, headers = error.code, error.headers
+            queries = headers.get('X-DB-Query-Count')
+            return (
+                status, time.monotonic() - started,
+                int(queries) if queries is not None else None,
+            )
+        return send
+
+    def build_report(self, results, elapsed):
+        """Перцентили задержек, ошибки и SQL-запросы по именам замеров."""
+        grouped = defaultdict(list)
+        for name, status, duration, queries in results:
+            grouped[name].append((status, duration, queries))
+        endpoints = {}
+        for name, rows in sorted(grouped.items()):
+            latencies = sorted(duration * 1000 for _, duration, _ in rows)
+            queries = [count for _, _, count in rows if count is not None]
+            endpoints[name] = {
+                'count': len(rows),
+                'errors': sum(status >= 400 for status, _, _ in rows),
+                'mean_ms': round(sum(latencies) / len(latencies), 2),
+                'p50_ms': round(percentile(latencies, 0.50), 2),
+                'p95_ms': round(percentile(latencies, 0.95), 2),
+                'p99_ms': round(percentile(latencies, 0.99), 2),
+                'queries_mean': (
+                    round(sum(queries) / len(queries), 2) if queries
+                    else None
+                ),
+                'queries_max': max(queries) if queries else None,
+            }
+        latencies = sorted(duration * 1000 for _, _, duration, _ in results)
+        return {
+            'endpoints': endpoints,
+            'total': {
+                'count': len(results),
+                'elapsed_s': round(elapsed, 3),
+                'p50_ms': round(percentile(latencies, 0.50), 2),
+                'p95_ms': round(percentile(latencies, 0.95), 2),
+                'p99_ms': round(percentile(latencies, 0.99), 2),
+                'throughput_rps': round(len(results) / elapsed, 2),
+            },
+        }
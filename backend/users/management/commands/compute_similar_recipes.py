@@ -0,0 +1,199 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Max, Q
+from django.utils import timezone
+from scipy import sparse
+
+from users.models import Recipe, SimilarRecipe
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    """
+    Расчёт списков похожих рецептов (SimilarRecipe).
+    """
+    help = (
+        'Считает для рецептов top-k похожих по ингредиентам и тегам и '
+        'сохраняет их в таблицу похожих рецептов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Только рецепты, изменённые после прошлого расчёта, и '
+                 'их соседи.',
+        )
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=settings.SIMILAR_RECIPES_TOP_K,
+            help='Количество похожих рецептов на рецепт.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Количество рецептов в одном матричном умножении.',
+        )
+
+    def handle(self, *args, **options):
+        """
+        Строит разреженные векторы рецептов и пересчитывает списки
+        соседей пачками; каждая пачка заменяется в своей транзакции.
+
+        Сходство — косинус TF-IDF векторов ингредиентов, смешанный с
+        косинусом наборов тегов. Кандидаты берутся только среди рецептов
+        с общими ингредиентами, поэтому теги лишь уточняют порядок.
+        """
+        started = time.monotonic()
+        computed_at = timezone.now()
+        self.top_k = options['top_k']
+        self.load_vectors()
+        if options['incremental']:
+            stale = self.get_stale_rows()
+            neighbours = self.update(stale, computed_at, options)
+            neighbours.update(self.positions(
+                SimilarRecipe.objects.filter(
+                    similar__in=self.recipe_ids[stale].tolist()
+                ).values_list('recipe_id', flat=True)
+            ))
+            rows = np.setdiff1d(
+                np.fromiter(neighbours, dtype=np.int64), stale
+            )
+            self.update(rows, computed_at, options)
+            updated = len(stale) + len(rows)
+        else:
+            rows = np.arange(len(self.recipe_ids))
+            self.update(rows, computed_at, options)
+            updated = len(rows)
+        self.stdout.write(self.style.SUCCESS(
+            f'Похожие рецепты пересчитаны. Рецептов: {updated}. '
+            f'Время: {time.monotonic() - started:.2f} с.'
+        ))
+
+    def load_vectors(self):
+        """Нормированные TF-IDF векторы ингредиентов и наборы тегов."""
+        recipe_ids = []
+        sizes = [0]
+        values = []
+        rows = Recipe.objects.exclude(ingredient_ids=None).order_by(
+            'id'
+        ).values_list('id', 'ingredient_ids')
+        for recipe_id, ids in rows.iterator(chunk_size=10_000):
+            recipe_ids.append(recipe_id)
+            sizes.append(len(ids))
+            values.extend(ids)
+        self.recipe_ids = np.asarray(recipe_ids, dtype=np.int64)
+        count = len(recipe_ids)
+        _, columns = np.unique(
+            np.asarray(values, dtype=np.int64), return_inverse=True
+        )
+        frequency = np.bincount(columns)
+        idf = np.log(count / np.maximum(frequency, 1))
+        idf[frequency > settings.SIMILAR_RECIPES_MAX_DF * count] = 0
+        vectors = sparse.csr_matrix(
+            (idf[columns], columns, np.cumsum(sizes)),
+            shape=(count, len(frequency)),
+        )
+        vectors.eliminate_zeros()
+        norms = np.sqrt(np.asarray(vectors.multiply(vectors).sum(axis=1)))
+        self.vectors = sparse.diags(
+            1 / np.maximum(norms.ravel(), 1e-12)
+        ) @ vectors
+        self.vectors_t = self.vectors.T.tocsr()
+
+        # Наборов тегов немного, поэтому их сходство считается один раз
+        # для всех пар наборов.
+        tags = [set() for _ in recipe_ids]
+        for recipe_id, tag_id in Recipe.tags.through.objects.values_list(
+            'recipe_id', 'tag_id'
+        ).iterator(chunk_size=10_000):
+            position = np.searchsorted(self.recipe_ids, recipe_id)
+            if (position < count
+                    and self.recipe_ids[position] == recipe_id):
+                tags[position].add(tag_id)
+        tag_sets = {}
+        self.tag_set_ids = np.array([
+            tag_sets.setdefault(frozenset(recipe_tags), len(tag_sets))
+            for recipe_tags in tags
+        ], dtype=np.int64)
+        tag_sets = list(tag_sets)
+        self.tag_similarity = np.array([[
+            len(first & second) / (len(first) * len(second)) ** 0.5
+            if first and second else 0.0
+            for second in tag_sets
+        ] for first in tag_sets])
+
+    def positions(self, recipe_ids):
+        """Номера строк матрицы для id рецептов, которые в ней есть."""
+        recipe_ids = np.fromiter(recipe_ids, dtype=np.int64)
+        if not len(self.recipe_ids):
+            return set()
+        positions = np.minimum(
+            np.searchsorted(self.recipe_ids, recipe_ids),
+            len(self.recipe_ids) - 1,
+        )
+        return set(
+            positions[self.recipe_ids[positions] == recipe_ids].tolist()
+        )
+
+    def get_stale_rows(self):
+        """Рецепты без списка соседей или изменённые после его расчёта."""
+        return np.array(sorted(self.positions(
+            Recipe.objects.alias(
+                computed_at=Max('similar_recipes__computed_at')
+            ).filter(
+                Q(computed_at=None) | Q(updated_at__gt=F('computed_at'))
+            ).values_list('id', flat=True)
+        )), dtype=np.int64)
+
+    def update(self, rows, computed_at, options):
+        """Пересчитывает и сохраняет соседей рецептов rows.
+
+        Возвращает номера строк всех найденных соседей.
+        """
+        neighbours = set()
+        batch_size = options['batch_size']
+        weight = settings.SIMILAR_RECIPES_TAG_WEIGHT
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            scores = (self.vectors[batch] @ self.vectors_t).tocoo()
+            keep = scores.col != batch[scores.row]
+            row, col = scores.row[keep], scores.col[keep]
+            score = (1 - weight) * scores.data[keep] + weight * (
+                self.tag_similarity[
+                    self.tag_set_ids[batch[row]], self.tag_set_ids[col]
+                ]
+            )
+            # Сортировка по строке, затем по убыванию сходства и id.
+            order = np.lexsort((-self.recipe_ids[col], -score, row))
+            row, col, score = row[order], col[order], score[order]
+            first = np.searchsorted(row, row, side='left')
+            top = np.arange(len(row)) - first < self.top_k
+            row, col, score = row[top], col[top], score[top]
+            neighbours.update(col.tolist())
+            recipe_ids = self.recipe_ids[batch]
+            with transaction.atomic():
+                SimilarRecipe.objects.filter(
+                    recipe__in=recipe_ids.tolist()
+                ).delete()
+                SimilarRecipe.objects.bulk_create(
+                    SimilarRecipe(
+                        recipe_id=recipe_id,
+                        similar_id=similar_id,
+                        score=value,
+                        computed_at=computed_at,
+                    )
+                    for recipe_id, similar_id, value in zip(
+                        recipe_ids[row].tolist(),
+                        self.recipe_ids[col].tolist(),
+                        score.tolist(),
+                    )
+                )
+        return neighbours
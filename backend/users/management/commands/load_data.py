@@ -1,100 +1,186 @@
+import argparse
 import csv
+import json
 import logging
+import time
+from itertools import islice
+from pathlib import Path
 
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from users.models import Ingredient
 
+BATCH_SIZE = 1000
+
+
+def positive_int(value):
+    """Целое число не меньше 1 для аргументов командной строки."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(
+            f'ожидается целое число не меньше 1, получено {value}'
+        )
+    return number
+
 
 class Command(BaseCommand):
     """
-    Импорт данных из CSV-файла в базу данных (модель Ingredient).
+    Импорт ингредиентов из CSV- или JSON-файла в базу данных.
     """
-    help = 'Импорт данных из CSV-файла в модель Ingredient'
+    help = 'Импорт данных из CSV- или JSON-файла в модель Ingredient'
 
     def add_arguments(self, parser):
         """
-        Определяет аргумент командной строки для указания пути к CSV-файлу.
+        Определяет аргументы командной строки.
         """
         parser.add_argument(
             '--path',
             type=str,
-            help='Путь к CSV-файлу с данными ингредиентов.',
+            help='Путь к CSV- или JSON-файлу с данными ингредиентов.',
+        )
+        parser.add_argument(
+            '--format',
+            choices=('csv', 'json'),
+            help='Формат файла. По умолчанию определяется по расширению.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=positive_int,
+            default=BATCH_SIZE,
+            help='Количество ингредиентов в одном INSERT.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Проверить файл без записи в базу.',
         )
 
     def handle(self, *args, **options):
         """
-        Обрабатывает импорт данных из CSV-файла в модель Ingredient.
+        Пачками добавляет ингредиенты, пропуская уже существующие.
         """
-        csv_file_path = options['path']
-        if not csv_file_path:
+        file_path = options['path']
+        if not file_path:
             self.stdout.write(
                 self.style.ERROR(
-                    'Не указан путь к CSV-файлу.'
+                    'Не указан путь к файлу. '
                     'Используйте --path <путь_к_файлу>.'
                 )
             )
             return
 
-        success_count = 0
-        error_count = 0
+        file_format = options['format'] or (
+            'json' if Path(file_path).suffix.lower() == '.json' else 'csv'
+        )
+        started = time.monotonic()
+        self.error_count = 0
         try:
-            with open(
-                    csv_file_path,
-                    'r',
-                    encoding='utf-8',
-            ) as csvfile:
-                reader = csv.reader(csvfile)
-                for row_number, row in enumerate(reader, start=1):
-                    if len(row) != 2:
-                        self.stdout.write(
-                            self.style.WARNING(
-                                f'Строка {row_number} пропущена: '
-                                f'неверное количество столбцов ({len(row)}).'
-                            )
-                        )
-                        error_count += 1
-                        continue
-
-                    name, measurement_unit = row
-                    try:
-                        ingredient, created = Ingredient.objects.get_or_create(
-                            name=name, measurement_unit=measurement_unit
-                        )
-                        if created:
-                            success_count += 1
-                            self.stdout.write(
-                                self.style.SUCCESS(
-                                    f'Ингредиент "{name}" успешно добавлен.'
-                                )
-                            )
-                        else:
-                            self.stdout.write(
-                                self.style.WARNING(
-                                    f'Ингредиент "{name}" уже существует.'
-                                )
-                            )
-                    except Exception as e:
-                        error_count += 1
-                        logging.exception(
-                            f'Ошибка при обработке строки {row_number}: {e}'
-                        )
-                        self.stdout.write(
-                            self.style.ERROR(
-                                f'Ошибка добавления ингредиента {name}: {e}'
-                            )
-                        )
-
-            self.stdout.write(
-                self.style.SUCCESS(
-                    f'Импорт завершен. Добавлено: {success_count}, '
-                    f'Ошибок: {error_count}.'
+            with open(file_path, 'r', encoding='utf-8') as file:
+                rows = (
+                    self.read_json(file) if file_format == 'json'
+                    else self.read_csv(file)
                 )
-            )
-
+                if options['dry_run']:
+                    total, new = self.count_new(rows)
+                    message = (
+                        f'Проверка завершена. Ингредиентов в файле: {total}, '
+                        f'из них новых: {new}, ошибок: {self.error_count}.'
+                    )
+                else:
+                    total, new = self.load(rows, options['batch_size'])
+                    message = (
+                        f'Импорт завершен. Ингредиентов в файле: {total}, '
+                        f'добавлено: {new}, ошибок: {self.error_count}.'
+                    )
         except FileNotFoundError:
             self.stdout.write(
-                self.style.ERROR(f'Файл "{csv_file_path}" не найден.')
+                self.style.ERROR(f'Файл "{file_path}" не найден.')
             )
+            return
         except Exception as e:
             logging.exception(f'Общая ошибка импорта: {e}')
             self.stdout.write(self.style.ERROR(f'Общая ошибка импорта: {e}'))
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{message} Время: {time.monotonic() - started:.2f} с.'
+            )
+        )
+
+    def read_csv(self, file):
+        """
+        Читает строки CSV вида: название,единица измерения.
+        """
+        for row_number, row in enumerate(csv.reader(file), start=1):
+            if len(row) != 2:
+                self.skip(
+                    row_number,
+                    f'неверное количество столбцов ({len(row)})'
+                )
+                continue
+            yield from self.clean_row(row_number, *row)
+
+    def read_json(self, file):
+        """
+        Читает список объектов с ключами name и measurement_unit.
+        """
+        for row_number, item in enumerate(json.load(file), start=1):
+            try:
+                name, measurement_unit = (
+                    item['name'], item['measurement_unit']
+                )
+            except (KeyError, TypeError):
+                self.skip(row_number, 'нет name или measurement_unit')
+                continue
+            yield from self.clean_row(row_number, name, measurement_unit)
+
+    def clean_row(self, row_number, name, measurement_unit):
+        name, measurement_unit = name.strip(), measurement_unit.strip()
+        if not name or not measurement_unit:
+            self.skip(row_number, 'пустое значение')
+        elif len(name) > settings.MAX_INGREDIENT_NAME_LENGTH:
+            self.skip(row_number, 'слишком длинное название')
+        elif len(measurement_unit) > settings.MAX_MEASUREMENT_UNIT_LENGTH:
+            self.skip(row_number, 'слишком длинная единица измерения')
+        else:
+            yield name, measurement_unit
+
+    def skip(self, row_number, reason):
+        self.error_count += 1
+        self.stdout.write(
+            self.style.WARNING(f'Строка {row_number} пропущена: {reason}.')
+        )
+
+    def load(self, rows, batch_size):
+        """
+        Вставляет ингредиенты пачками, дубликаты отбрасывает база.
+        """
+        count_before = Ingredient.objects.count()
+        total = 0
+        rows = iter(rows)
+        while batch := list(islice(rows, batch_size)):
+            total += len(batch)
+            Ingredient.objects.bulk_create(
+                (
+                    Ingredient(name=name, measurement_unit=measurement_unit)
+                    for name, measurement_unit in batch
+                ),
+                ignore_conflicts=True,
+            )
+        new = Ingredient.objects.count() - count_before
+        if new:
+            from api.ingredient_index import ingredient_index
+
+            ingredient_index.invalidate()
+        return total, new
+
+    def count_new(self, rows):
+        """
+        Считает ингредиенты файла, которых ещё нет в базе.
+        """
+        existing = set(
+            Ingredient.objects.values_list('name', 'measurement_unit')
+        )
+        rows = set(rows)
+        return len(rows), len(rows - existing)
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from users.models import Recipe
+
+BATCH_SIZE = 10_000
+
+
+class Command(BaseCommand):
+    """
+    Пересчёт поисковых документов и массивов ингредиентов рецептов
+    (Recipe.search_vector, Recipe.ingredient_ids).
+    """
+    help = (
+        'Пересчитывает поисковые документы и массивы ингредиентов рецептов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Количество рецептов в одном UPDATE.',
+        )
+        parser.add_argument(
+            '--missing',
+            action='store_true',
+            help='Только рецепты, для которых они ещё не посчитаны.',
+        )
+
+    def handle(self, *args, **options):
+        """
+        Обновляет рецепты пачками по возрастанию id, каждую пачку в своей
+        транзакции, чтобы не держать блокировки на всей таблице.
+        """
+        batch_size = options['batch_size']
+        recipes = Recipe.objects.order_by('id')
+        if options['missing']:
+            recipes = recipes.filter(
+                Q(search_vector__isnull=True) | Q(ingredient_ids__isnull=True)
+            )
+        updated = 0
+        last_id = 0
+        while True:
+            ids = list(recipes.filter(id__gt=last_id).values_list(
+                'id', flat=True
+            )[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                updated += Recipe.objects.filter(
+                    id__in=ids
+                ).update_index_fields()
+            last_id = ids[-1]
+        self.stdout.write(self.style.SUCCESS(
+            f'Поисковые данные рецептов пересчитаны. Рецептов: {updated}.'
+        ))
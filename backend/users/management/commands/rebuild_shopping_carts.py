@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+
+from users.models import RecipeToIngredient, ShoppingCartIngredient
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    """
+    Полная пересборка агрегата списков покупок (ShoppingCartIngredient).
+    """
+    help = 'Пересчитывает суммарные ингредиенты списков покупок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Размер пачки строк при вставке.',
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        """
+        Удаляет агрегат и строит его заново из списков покупок.
+        """
+        batch_size = options['batch_size']
+        ShoppingCartIngredient.objects.all().delete()
+        rows = RecipeToIngredient.objects.filter(
+            recipe__shopping_list__isnull=False
+        ).values(
+            'recipe__shopping_list__user', 'ingredient',
+        ).annotate(
+            total=Sum('amount'),
+        ).order_by().iterator(chunk_size=batch_size)
+
+        batch = []
+        created = 0
+        for row in rows:
+            batch.append(ShoppingCartIngredient(
+                user_id=row['recipe__shopping_list__user'],
+                ingredient_id=row['ingredient'],
+                amount=row['total'],
+            ))
+            if len(batch) >= batch_size:
+                ShoppingCartIngredient.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        ShoppingCartIngredient.objects.bulk_create(batch)
+        created += len(batch)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Агрегат списков покупок пересобран. Строк: {created}.'
+            )
+        )
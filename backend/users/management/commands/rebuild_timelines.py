@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from users.models import Follow, Recipe, TimelineEntry, User
+
+
+class Command(BaseCommand):
+    """
+    Заполнение лент подписок для уже опубликованных рецептов.
+    """
+    help = 'Рассылает в ленты подписчиков последние рецепты авторов'
+
+    def handle(self, *args, **options):
+        """
+        Для каждого автора с не более чем FEED_FANOUT_MAX_FOLLOWERS
+        подписчиками добавляет FEED_BACKFILL_SIZE его последних рецептов в
+        ленты подписчиков, как при новой подписке, и отмечает его рецепты
+        разосланными. Рецепты остальных авторов лента читает через
+        подписки.
+        """
+        limit = settings.FEED_FANOUT_MAX_FOLLOWERS
+        fanned_out = skipped = 0
+        authors = User.objects.filter(recipes_count__gt=0).order_by('id')
+        for author_id in authors.values_list('id', flat=True).iterator():
+            followers = list(Follow.objects.filter(
+                author_id=author_id
+            ).values_list('user_id', flat=True)[:limit + 1])
+            if len(followers) > limit:
+                skipped += 1
+                continue
+            recipes = Recipe.objects.filter(author_id=author_id)
+            with transaction.atomic():
+                recipes.filter(fanned_out=False).update(fanned_out=True)
+                recipe_ids = list(recipes.order_by('-id').values_list(
+                    'id', flat=True
+                )[:settings.FEED_BACKFILL_SIZE])
+                TimelineEntry.objects.bulk_create(
+                    (TimelineEntry(user_id=user_id, recipe_id=recipe_id)
+                     for user_id in followers for recipe_id in recipe_ids),
+                    batch_size=settings.FEED_FANOUT_BATCH_SIZE,
+                    ignore_conflicts=True,
+                )
+            fanned_out += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты заполнены. Авторов: {fanned_out}, читаются через '
+            f'подписки: {skipped}.'
+        ))
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from users.models import Favorite, Recipe, User
+
+
+def count_subquery(model, field):
+    """Подзапрос с количеством строк model, ссылающихся на внешнюю строку."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by().values(field).annotate(count=Count('pk'))
+            .values('count'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    """
+    Сверка денормализованных счётчиков Recipe.favorites_count и
+    User.recipes_count с фактическими данными.
+    """
+    help = 'Исправляет расхождения счётчиков избранного и рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать количество расхождений.',
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        """
+        Одним UPDATE на модель пересчитывает счётчики, которые разошлись.
+        """
+        counters = (
+            (Recipe, 'favorites_count', count_subquery(Favorite, 'recipe')),
+            (User, 'recipes_count', count_subquery(Recipe, 'author')),
+        )
+        for model, field, actual in counters:
+            drifted = model.objects.alias(actual=actual).filter(
+                ~Q(**{field: actual})
+            )
+            if options['dry_run']:
+                fixed = drifted.count()
+            else:
+                fixed = drifted.update(**{field: actual})
+            self.stdout.write(
+                f'{model._meta.label}.{field}: расхождений {fixed}.'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Проверка завершена.' if options['dry_run']
+            else 'Счётчики сверены.'
+        ))
@@ -0,0 +1,227 @@
+import io
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+
+from users.models import (Favorite, Follow, Ingredient, Recipe,
+                          RecipeToIngredient, ShoppingList, Tag, User)
+
+BATCH_SIZE = 5000
+PASSWORD = 'bench-password'
+TAGS = (
+    ('Завтрак', 'breakfast'),
+    ('Обед', 'lunch'),
+    ('Ужин', 'dinner'),
+    ('Десерт', 'dessert'),
+    ('Выпечка', 'bakery'),
+    ('Вегетарианское', 'vegetarian'),
+)
+WORDS = (
+    'суп', 'салат', 'пирог', 'каша', 'рагу', 'запеканка', 'паста', 'плов',
+    'омлет', 'блины', 'котлеты', 'гуляш', 'рис', 'курица', 'овощи', 'сыр',
+    'грибы', 'тыква', 'яблоки', 'творог', 'рыба', 'говядина', 'фасоль',
+)
+
+
+class Command(BaseCommand):
+    """
+    Воспроизводимый синтетический набор данных для нагрузочных замеров.
+    """
+    help = (
+        'Создаёт пользователей, рецепты, подписки, избранное и списки '
+        'покупок на основе загруженных ингредиентов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000,
+                            help='Количество пользователей.')
+        parser.add_argument('--recipes-per-user', type=int, default=5,
+                            help='Среднее количество рецептов автора.')
+        parser.add_argument('--follows-per-user', type=int, default=10,
+                            help='Подписок на пользователя.')
+        parser.add_argument('--favorites-per-user', type=int, default=20,
+                            help='Рецептов в избранном пользователя.')
+        parser.add_argument('--cart-per-user', type=int, default=5,
+                            help='Рецептов в списке покупок пользователя.')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Зерно генератора случайных чисел.')
+        parser.add_argument('--prefix', default='bench',
+                            help='Префикс имён синтетических пользователей.')
+        parser.add_argument('--clear', action='store_true',
+                            help='Удалить ранее созданный набор с префиксом.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Размер пачки строк при вставке.')
+
+    def handle(self, *args, **options):
+        """
+        Создаёт набор пачками в одной транзакции и пересчитывает
+        денормализованные данные, которые bulk_create не обновляет.
+        """
+        self.batch_size = options['batch_size']
+        self.random = random.Random(options['seed'])
+        prefix = options['prefix']
+        existing = User.objects.filter(username__startswith=f'{prefix}_')
+        if existing.exists():
+            if not options['clear']:
+                raise CommandError(
+                    f'Пользователи с префиксом {prefix} уже есть. '
+                    'Используйте --clear.'
+                )
+            existing.delete()
+
+        ingredient_ids = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True)
+        )
+        if not ingredient_ids:
+            raise CommandError(
+                'Нет ингредиентов. Сначала выполните '
+                'load_data --path data/ingredients.csv.'
+            )
+
+        started = time.monotonic()
+        with transaction.atomic():
+            tag_ids = self.create_tags()
+            user_ids = self.create_users(prefix, options['users'])
+            recipe_ids = self.create_recipes(
+                prefix, user_ids, options['recipes_per_user']
+            )
+            self.create_recipe_relations(recipe_ids, ingredient_ids, tag_ids)
+            self.create_follows(user_ids, options['follows_per_user'])
+            self.create_user_recipes(
+                Favorite, user_ids, recipe_ids,
+                options['favorites_per_user'],
+            )
+            self.create_user_recipes(
+                ShoppingList, user_ids, recipe_ids, options['cart_per_user'],
+            )
+            call_command('reconcile_counters', stdout=self.stdout)
+            call_command('rebuild_shopping_carts', stdout=self.stdout)
+            call_command(
+                'rebuild_recipe_indexes', missing=True, stdout=self.stdout
+            )
+            call_command('rebuild_timelines', stdout=self.stdout)
+        from api.caching import bump_recipe_data_version
+
+        bump_recipe_data_version()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(user_ids)}, рецептов: '
+            f'{len(recipe_ids)}. Пароль: {PASSWORD}. '
+            f'Время: {time.monotonic() - started:.2f} с.'
+        ))
+
+    def bulk_create(self, model, objects):
+        return model.objects.bulk_create(objects, batch_size=self.batch_size)
+
+    def create_tags(self):
+        for name, slug in TAGS:
+            Tag.objects.get_or_create(slug=slug, defaults={'name': name})
+        return list(Tag.objects.order_by('id').values_list('id', flat=True))
+
+    def create_users(self, prefix, count):
+        password = make_password(PASSWORD)
+        users = self.bulk_create(User, (
+            User(
+                username=f'{prefix}_{number:06d}',
+                email=f'{prefix}_{number:06d}@example.com',
+                first_name='Пользователь',
+                last_name=f'Номер {number}',
+                password=password,
+            )
+            for number in range(count)
+        ))
+        return [user.id for user in users]
+
+    def create_recipes(self, prefix, user_ids, per_user):
+        """
+        Рецепты с общей картинкой; число рецептов автора — от 0 до
+        удвоенного среднего.
+        """
+        image = default_storage.save(
+            f'media/recipes_images/{prefix}.png', ContentFile(self.png())
+        )
+        recipes = (
+            Recipe(
+                author_id=author_id,
+                name=' '.join(self.random.sample(WORDS, 3)).capitalize(),
+                text=' '.join(self.random.choices(WORDS, k=40)),
+                cooking_time=self.random.randint(5, 180),
+                image=image,
+            )
+            for author_id in user_ids
+            for _ in range(self.random.randint(0, per_user * 2))
+        )
+        return [recipe.id for recipe in self.bulk_create(Recipe, recipes)]
+
+    def create_recipe_relations(self, recipe_ids, ingredient_ids, tag_ids):
+        """Ингредиенты и теги рецептов; частые ингредиенты встречаются
+        чаще."""
+        weights = [
+            1 / (position + 1) for position in range(len(ingredient_ids))
+        ]
+        self.random.shuffle(weights)
+        tags_through = Recipe.tags.through
+        ingredients, tags = [], []
+        for recipe_id in recipe_ids:
+            chosen = sorted(set(self.random.choices(
+                ingredient_ids, weights, k=self.random.randint(3, 12)
+            )))
+            ingredients.extend(
+                RecipeToIngredient(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=self.random.randint(1, 100),
+                )
+                for ingredient_id in chosen
+            )
+            tags.extend(
+                tags_through(recipe_id=recipe_id, tag_id=tag_id)
+                for tag_id in self.random.sample(
+                    tag_ids, self.random.randint(1, min(3, len(tag_ids)))
+                )
+            )
+        self.bulk_create(RecipeToIngredient, ingredients)
+        self.bulk_create(tags_through, tags)
+
+    def create_follows(self, user_ids, per_user):
+        """Подписки: популярные авторы получают больше подписчиков."""
+        if len(user_ids) < 2:
+            return
+        weights = [1 / (rank + 1) for rank in range(len(user_ids))]
+        follows = []
+        for user_id in user_ids:
+            authors = set(self.random.choices(user_ids, weights, k=per_user))
+            authors.discard(user_id)
+            follows.extend(
+                Follow(user_id=user_id, author_id=author_id)
+                for author_id in sorted(authors)
+            )
+        self.bulk_create(Follow, follows)
+
+    def create_user_recipes(self, model, user_ids, recipe_ids, per_user):
+        if not recipe_ids:
+            return
+        rows = []
+        for user_id in user_ids:
+            chosen = {
+                self.random.choice(recipe_ids) for _ in range(per_user)
+            }
+            rows.extend(
+                model(user_id=user_id, recipe_id=recipe_id)
+                for recipe_id in sorted(chosen)
+            )
+        self.bulk_create(model, rows)
+
+    def png(self):
+        """Картинка-заглушка, общая для всех рецептов набора."""
+        image = Image.new('RGB', (480, 360), (230, 160, 90))
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG')
+        return buffer.getvalue()
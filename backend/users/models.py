@@ -1,5 +1,13 @@
+from itertools import islice
+
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.contrib.postgres.aggregates import ArrayAgg, StringAgg
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, SearchVectorField)
+from django.db import connection, models
+from django.db.models.functions import Coalesce, Upper
 
 from django.conf import settings
 
@@ -76,6 +84,17 @@ class User(AbstractUser):
         null=True,
         upload_to='media/users_avatars/'
     )
+    avatar_variants = models.JSONField(
+        'Варианты фото профиля',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+        editable=False,
+    )
 
     REQUIRED_FIELDS = [
         'first_name',
@@ -125,6 +144,103 @@ class Favorite(models.Model):
                 f'пользователю {self.user}')
 
 
+class RecipeQuerySet(models.QuerySet):
+    """QuerySet рецептов с заготовками для выдачи через API."""
+
+    def with_related(self):
+        """Подгружает автора, теги и ингредиенты рецептов.
+
+        Поисковый документ и массив id ингредиентов в выдаче не нужны и
+        не читаются.
+        """
+        return self.select_related('author').defer(
+            'search_vector', 'ingredient_ids'
+        ).prefetch_related(
+            models.Prefetch(
+                'ingredient_list',
+                queryset=RecipeToIngredient.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+            'tags',
+        )
+
+    def with_user_flags(self, user):
+        """Аннотирует флаги is_favorited и is_in_shopping_cart."""
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=models.Value(False),
+                is_in_shopping_cart=models.Value(False),
+            )
+        return self.annotate(
+            is_favorited=models.Exists(
+                Favorite.objects.filter(
+                    recipe=models.OuterRef('pk'), user=user
+                )
+            ),
+            is_in_shopping_cart=models.Exists(
+                ShoppingList.objects.filter(
+                    recipe=models.OuterRef('pk'), user=user
+                )
+            ),
+        )
+
+    def search(self, value):
+        """Полнотекстовый поиск, самые релевантные рецепты первыми."""
+        query = SearchQuery(
+            value, config=settings.SEARCH_CONFIG, search_type='websearch'
+        )
+        return self.filter(search_vector=query).annotate(
+            search_rank=SearchRank(models.F('search_vector'), query)
+        ).order_by('-search_rank', '-id')
+
+    def with_ingredients(self, ingredient_ids):
+        """Рецепты, в которых есть все ингредиенты (@> по GIN-индексу)."""
+        return self.filter(ingredient_ids__contains=sorted(ingredient_ids))
+
+    def without_ingredients(self, ingredient_ids):
+        """Рецепты без единого из ингредиентов.
+
+        Проверка идёт по массиву в строке рецепта, без подзапроса к
+        RecipeToIngredient; рецепты с ещё не посчитанным массивом
+        исключаются.
+        """
+        return self.filter(ingredient_ids__isnull=False).exclude(
+            ingredient_ids__overlap=sorted(ingredient_ids)
+        )
+
+    def update_index_fields(self):
+        """Пересчитывает поисковый документ и массив id ингредиентов
+        рецептов одним UPDATE.
+
+        Вес в поисковом документе: A — название, B — названия
+        ингредиентов, C — описание.
+        """
+        config = settings.SEARCH_CONFIG
+        recipe_ingredients = RecipeToIngredient.objects.filter(
+            recipe=models.OuterRef('pk')
+        ).order_by().values('recipe')
+        ingredient_names = models.Subquery(recipe_ingredients.annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names'))
+        return self.update(
+            search_vector=(
+                SearchVector('name', weight='A', config=config)
+                + SearchVector(
+                    Coalesce(
+                        ingredient_names, models.Value(''),
+                        output_field=models.TextField(),
+                    ),
+                    weight='B', config=config,
+                )
+                + SearchVector('text', weight='C', config=config)
+            ),
+            ingredient_ids=models.Subquery(recipe_ingredients.annotate(
+                ids=ArrayAgg('ingredient_id', ordering='ingredient_id')
+            ).values('ids')),
+        )
+
+
 class Recipe(models.Model):
     """Модель, представляющая рецепт."""
 
@@ -159,16 +275,201 @@ class Recipe(models.Model):
         verbose_name='Картинка блюда',
         upload_to='media/recipes_images/'
     )
+    image_variants = models.JSONField(
+        'Варианты картинки',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False,
+        db_index=True,
+    )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+        db_index=True,
+    )
+    search_vector = SearchVectorField(
+        'Поисковый документ',
+        null=True,
+        editable=False,
+    )
+    ingredient_ids = ArrayField(
+        models.BigIntegerField(),
+        verbose_name='id ингредиентов по возрастанию',
+        null=True,
+        editable=False,
+    )
+    fanned_out = models.BooleanField(
+        'Разослан в ленты подписчиков',
+        default=False,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ('-id',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = (
+            GinIndex(fields=('search_vector',), name='recipe_search_idx'),
+            GinIndex(
+                fields=('ingredient_ids',), name='recipe_ingredient_ids_idx'
+            ),
+            # Рецепты, которые лента подписок читает через подписки.
+            models.Index(
+                fields=('author', '-id'),
+                condition=models.Q(fanned_out=False),
+                name='recipe_fan_out_on_read_idx',
+            ),
+        )
 
     def __str__(self):
         return self.name
 
 
+class SimilarRecipe(models.Model):
+    """Похожий рецепт из предрасчитанного списка соседей рецепта."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        related_name='similar_recipes',
+        verbose_name='Рецепт',
+        on_delete=models.CASCADE
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        related_name='similar_to',
+        verbose_name='Похожий рецепт',
+        on_delete=models.CASCADE
+    )
+    score = models.FloatField('Сходство')
+    computed_at = models.DateTimeField('Дата расчёта')
+
+    class Meta:
+        ordering = ('recipe', '-score')
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'similar'),
+                name='unique_similar_recipe',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.similar} похож на {self.recipe}'
+
+
+class TimelineEntryManager(models.Manager):
+    """
+    Ленты подписок: рецепты рассылаются подписчикам при публикации
+    Рецепты авторов, у которых больше FEED_FANOUT_MAX_FOLLOWERS
+    подписчиков, не рассылаются (fanned_out=False) и читаются лентой через
+    подписки
+    """
+
+    def fan_out(self, recipe):
+        """Добавляет рецепт в ленты подписчиков автора пачками.
+
+        Возвращает False, если у автора слишком много подписчиков.
+        """
+        followers = Follow.objects.filter(author_id=recipe.author_id)
+        limit = settings.FEED_FANOUT_MAX_FOLLOWERS
+        # Флаг ставится до рассылки: подписка, оформленная во время неё,
+        # догрузит рецепт в backfill. Число подписчиков проверяется тем же
+        # запросом.
+        if not Recipe.objects.filter(
+            ~models.Exists(followers[limit:limit + 1]), pk=recipe.pk
+        ).update(fanned_out=True):
+            return False
+        # Подписчики читаются и записываются пачками по порядку id, не
+        # загружаясь в память все сразу.
+        batch_size = settings.FEED_FANOUT_BATCH_SIZE
+        user_ids = followers.order_by('id').values_list(
+            'user_id', flat=True
+        ).iterator(chunk_size=batch_size)
+        while batch := list(islice(user_ids, batch_size)):
+            self.bulk_create(
+                [self.model(user_id=user_id, recipe_id=recipe.pk)
+                 for user_id in batch],
+                batch_size=batch_size,
+                ignore_conflicts=True,
+            )
+        return True
+
+    def backfill(self, user_id, author_id):
+        """Добавляет в ленту последние рецепты автора после подписки."""
+        recipe_ids = Recipe.objects.filter(
+            author_id=author_id, fanned_out=True
+        ).order_by('-id').values_list('id', flat=True)
+        self.bulk_create(
+            [self.model(user_id=user_id, recipe_id=recipe_id)
+             for recipe_id in recipe_ids[:settings.FEED_BACKFILL_SIZE]],
+            ignore_conflicts=True,
+        )
+
+    def prune(self, user_id, author_id):
+        """Убирает из ленты рецепты автора после отписки."""
+        self.filter(user_id=user_id, recipe__author_id=author_id).delete()
+
+    def feed(self, user):
+        """Рецепты ленты подписок пользователя, новые первыми.
+
+        Обычно лента читается по индексу записей ленты; если пользователь
+        подписан на авторов с неразосланными рецептами, они добавляются
+        через подписки.
+        """
+        recipes = Recipe.objects.order_by('-id')
+        unsent_authors = list(Follow.objects.filter(user=user).filter(
+            models.Exists(Recipe.objects.filter(
+                author=models.OuterRef('author'), fanned_out=False
+            ))
+        ).values_list('author_id', flat=True))
+        if not unsent_authors:
+            return recipes.filter(timeline_entries__user=user)
+        return recipes.filter(
+            models.Q(pk__in=self.filter(user=user).values('recipe'))
+            | models.Q(author__in=unsent_authors, fanned_out=False)
+        )
+
+
+class TimelineEntry(models.Model):
+    """Рецепт в ленте подписок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        related_name='timeline',
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        related_name='timeline_entries',
+        verbose_name='Рецепт',
+        on_delete=models.CASCADE
+    )
+
+    objects = TimelineEntryManager()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_recipe_in_timeline',
+            ),
+        )
+
+    def __str__(self):
+        return f'Рецепт {self.recipe} в ленте {self.user}'
+
+
 class ShoppingList(models.Model):
     """Модель, представляющая список покупок пользователя."""
 
@@ -200,6 +501,109 @@ class ShoppingList(models.Model):
         return (f'Рецепт {self.recipe} в списке покупок у: {self.user}')
 
 
+class ShoppingCartIngredientManager(models.Manager):
+    """Инкрементальное обновление агрегата списков покупок."""
+
+    increment_sql = (
+        'INSERT INTO {aggregate} (user_id, ingredient_id, amount) '
+        'SELECT cart.user_id, delta.ingredient_id, delta.amount '
+        'FROM {cart} AS cart, (VALUES {values}) '
+        'AS delta (ingredient_id, amount) '
+        'WHERE cart.recipe_id = %s {user_filter} '
+        'ON CONFLICT (user_id, ingredient_id) '
+        'DO UPDATE SET amount = {aggregate}.amount + EXCLUDED.amount'
+    )
+    decrement_sql = (
+        'UPDATE {aggregate} AS aggregate '
+        'SET amount = GREATEST(aggregate.amount - delta.amount, 0) '
+        'FROM {cart} AS cart, (VALUES {values}) '
+        'AS delta (ingredient_id, amount) '
+        'WHERE cart.recipe_id = %s {user_filter} '
+        'AND aggregate.user_id = cart.user_id '
+        'AND aggregate.ingredient_id = delta.ingredient_id'
+    )
+
+    def add_recipe(self, recipe, user, sign=1):
+        """Добавляет ингредиенты рецепта в список покупок пользователя.
+
+        При sign=-1 ингредиенты рецепта вычитаются из списка.
+        """
+        self.apply_deltas(recipe, {
+            ingredient_id: sign * amount
+            for ingredient_id, amount in recipe.ingredient_list.values_list(
+                'ingredient_id', 'amount'
+            )
+        }, user=user)
+
+    def apply_deltas(self, recipe, deltas, user=None):
+        """Применяет изменения количеств {ingredient_id: amount}.
+
+        Изменения получают все списки покупок, в которых есть рецепт,
+        либо только список user. Строки с нулевым количеством удаляются.
+        """
+        increments = [(key, value) for key, value in deltas.items()
+                      if value > 0]
+        decrements = [(key, -value) for key, value in deltas.items()
+                      if value < 0]
+        if increments:
+            self._execute(self.increment_sql, increments, recipe, user)
+        if decrements:
+            self._execute(self.decrement_sql, decrements, recipe, user)
+            carts = ShoppingList.objects.filter(recipe=recipe)
+            if user is not None:
+                carts = carts.filter(user=user)
+            self.filter(amount=0, user__in=carts.values('user')).delete()
+
+    def _execute(self, sql, rows, recipe, user):
+        params = [param for row in rows for param in row]
+        params.append(recipe.pk)
+        user_filter = ''
+        if user is not None:
+            user_filter = 'AND cart.user_id = %s'
+            params.append(user.pk)
+        quote_name = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(sql.format(
+                aggregate=quote_name(self.model._meta.db_table),
+                cart=quote_name(ShoppingList._meta.db_table),
+                values=', '.join(['(%s, %s)'] * len(rows)),
+                user_filter=user_filter,
+            ), params)
+
+
+class ShoppingCartIngredient(models.Model):
+    """Суммарное количество ингредиента в списке покупок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        related_name='shopping_cart_ingredients',
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE
+    )
+    ingredient = models.ForeignKey(
+        'Ingredient',
+        related_name='shopping_cart_ingredients',
+        verbose_name='Ингредиент',
+        on_delete=models.CASCADE
+    )
+    amount = models.PositiveIntegerField('Количество')
+
+    objects = ShoppingCartIngredientManager()
+
+    class Meta:
+        verbose_name = 'Ингредиент списка покупок'
+        verbose_name_plural = 'Ингредиенты списков покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_ingredient_in_shopping_cart',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.ingredient} ({self.amount}) у {self.user}'
+
+
 class Ingredient(models.Model):
     """Модель, представляющая ингредиент."""
 
@@ -211,11 +615,28 @@ class Ingredient(models.Model):
         'Единица измерения',
         max_length=settings.MAX_MEASUREMENT_UNIT_LENGTH,
     )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+        db_index=True,
+    )
 
     class Meta:
         ordering = ('name',)
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        indexes = (
+            models.Index(
+                OpClass(Upper('name'), name='text_pattern_ops'),
+                name='ingredient_name_upper_idx',
+            ),
+        )
+        constraints = (
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient_name_unit',
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -270,6 +691,11 @@ class Tag(models.Model):
         unique=True,
         max_length=settings.TAG_MAX_LENGTH
     )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+        db_index=True,
+    )
 
     class Meta:
         verbose_name = 'Тег'
@@ -0,0 +1,206 @@
+import logging
+
+from django.apps import apps as global_apps
+from django.db import DatabaseError, connections, transaction
+from django.db.models import F
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from .models import (Favorite, Follow, Ingredient, Recipe,
+                     ShoppingCartIngredient, ShoppingList, TimelineEntry,
+                     User)
+
+logger = logging.getLogger(__name__)
+
+TRIGRAM_INDEX_SQL = (
+    'CREATE INDEX IF NOT EXISTS {index} '
+    'ON {table} USING gin (UPPER(name) gin_trgm_ops)'
+)
+# Поля, сохранение которых означает изменение поискового документа или
+# ингредиентов рецепта: сериализатор обновляет updated_at и при смене одних
+# ингредиентов.
+INDEX_SOURCE_FIELDS = {'name', 'text', 'updated_at'}
+TRIGRAM_INDEXES = (
+    ('Ingredient', 'ingredient_name_trgm_idx'),
+    ('Recipe', 'recipe_name_trgm_idx'),
+)
+
+
+def create_trigram_indexes(sender, using, apps=global_apps, **kwargs):
+    """
+    Создаёт GIN-индексы pg_trgm для поиска по подстроке названия
+    Индексы обслуживают UPPER(name) LIKE UPPER('%...%'), который строит
+    name__icontains в поиске ингредиентов и в поиске админки по рецептам.
+    Если расширение pg_trgm недоступно, поиск продолжает работать без
+    индексов.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    try:
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            for model_name, index in TRIGRAM_INDEXES:
+                table = apps.get_model('users', model_name)._meta.db_table
+                cursor.execute(TRIGRAM_INDEX_SQL.format(
+                    index=index, table=connection.ops.quote_name(table)
+                ))
+    except DatabaseError as error:
+        logger.warning('Индексы pg_trgm не созданы: %s', error)
+
+
+@receiver(post_save, sender=ShoppingList)
+def add_recipe_to_shopping_cart_ingredients(sender, instance, created,
+                                            **kwargs):
+    """Добавляет ингредиенты рецепта в агрегат списка покупок."""
+    if created:
+        ShoppingCartIngredient.objects.add_recipe(
+            instance.recipe, instance.user
+        )
+
+
+@receiver(pre_delete, sender=ShoppingList)
+def remove_recipe_from_shopping_cart_ingredients(sender, instance,
+                                                 **kwargs):
+    """Вычитает ингредиенты рецепта из агрегата списка покупок.
+
+    Срабатывает до удаления, в том числе каскадного, пока ингредиенты
+    рецепта ещё на месте.
+    """
+    ShoppingCartIngredient.objects.add_recipe(
+        instance.recipe, instance.user, sign=-1
+    )
+
+
+@receiver(post_save, sender=Favorite)
+def increment_favorites_count(sender, instance, created, **kwargs):
+    """Увеличивает счётчик избранного рецепта одним UPDATE."""
+    if created:
+        Recipe.objects.filter(pk=instance.recipe_id).update(
+            favorites_count=F('favorites_count') + 1
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+def decrement_favorites_count(sender, instance, **kwargs):
+    """Уменьшает счётчик избранного, в том числе при каскадном удалении."""
+    Recipe.objects.filter(
+        pk=instance.recipe_id, favorites_count__gt=0
+    ).update(favorites_count=F('favorites_count') - 1)
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(sender, instance, created, **kwargs):
+    """Увеличивает счётчик рецептов автора одним UPDATE."""
+    if created:
+        User.objects.filter(pk=instance.author_id).update(
+            recipes_count=F('recipes_count') + 1
+        )
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_previous_author(sender, instance, using, update_fields=None,
+                             **kwargs):
+    """Запоминает прежнего автора изменяемого рецепта для счётчиков.
+
+    Запрос выполняется только при сохранении без update_fields или с
+    автором в них: API автора рецепта не меняет, меняет админка.
+    """
+    instance._previous_author_id = None
+    if instance._state.adding or (
+        update_fields is not None
+        and not {'author', 'author_id'} & set(update_fields)
+    ):
+        return
+    instance._previous_author_id = Recipe.objects.using(using).filter(
+        pk=instance.pk
+    ).values_list('author_id', flat=True).first()
+
+
+@receiver(post_save, sender=Recipe)
+def move_recipes_count(sender, instance, created, **kwargs):
+    """Переносит рецепт в счётчик нового автора при смене автора."""
+    previous_author_id = getattr(instance, '_previous_author_id', None)
+    if created or previous_author_id in (None, instance.author_id):
+        return
+    User.objects.filter(
+        pk=previous_author_id, recipes_count__gt=0
+    ).update(recipes_count=F('recipes_count') - 1)
+    User.objects.filter(pk=instance.author_id).update(
+        recipes_count=F('recipes_count') + 1
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(sender, instance, **kwargs):
+    """Уменьшает счётчик рецептов автора, в том числе при каскадном
+    удалении."""
+    User.objects.filter(
+        pk=instance.author_id, recipes_count__gt=0
+    ).update(recipes_count=F('recipes_count') - 1)
+
+
+def refresh_index_fields(recipes):
+    """Пересчитывает поисковый документ и массив ингредиентов рецептов.
+
+    Поиск и фильтры по ингредиентам читают эти поля, поэтому после
+    UPDATE меняется версия данных рецептов и кеш ответов сбрасывается.
+    """
+    from api.caching import bump_recipe_data_version
+
+    recipes.update_index_fields()
+    bump_recipe_data_version()
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_index_fields(sender, instance, using, update_fields=None,
+                               **kwargs):
+    """Пересчитывает поисковый документ и массив ингредиентов рецепта
+    после фиксации транзакции.
+
+    К этому моменту сохранены и ингредиенты рецепта: сериализатор и
+    админка сохраняют рецепт вместе с ними в одной транзакции.
+    """
+    if update_fields and not INDEX_SOURCE_FIELDS & set(update_fields):
+        return
+    transaction.on_commit(
+        lambda: refresh_index_fields(Recipe.objects.filter(pk=instance.pk)),
+        using=using,
+    )
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_recipes_search_vector(sender, instance, created,
+                                            using, **kwargs):
+    """Пересчитывает поисковые документы рецептов с изменённым
+    ингредиентом."""
+    if not created:
+        transaction.on_commit(
+            lambda: refresh_index_fields(
+                Recipe.objects.filter(ingredients=instance.pk)
+            ),
+            using=using,
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, using, **kwargs):
+    """Рассылает новый рецепт в ленты подписчиков после фиксации."""
+    if created:
+        transaction.on_commit(
+            lambda: TimelineEntry.objects.fan_out(instance), using=using
+        )
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    """Добавляет в ленту подписчика последние рецепты автора."""
+    if created:
+        TimelineEntry.objects.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    """Убирает из ленты рецепты автора после отписки."""
+    TimelineEntry.objects.prune(instance.user_id, instance.author_id)